@@ -0,0 +1,270 @@
+import numpy as np
+from scipy import stats
+from DecisionTree2 import STRATEGIES, get_effect_multiplier
+
+
+class MomentAccumulator:
+    """ running means and co-moments of several columns of observations (Welford's method)
+    observations are added in batches; two accumulators are combined with the parallel update of Chan et al.,
+    so accumulators of parallel chunks can be merged without keeping the observations """
+
+    def __init__(self, n_columns):
+        """
+        :param n_columns: number of columns (variables) of each observation
+        """
+        self.n = 0
+        self.mean = np.zeros(n_columns)
+        self.comoment = np.zeros((n_columns, n_columns))  # sum of products of deviations from the mean
+
+    def add(self, x):
+        """
+        :param x: (numpy.array) of shape (number of observations, number of columns)
+        """
+        x = np.asarray(x, dtype=float)
+        if len(x) == 0:
+            return
+        batch = MomentAccumulator(x.shape[1])
+        batch.n = len(x)
+        batch.mean = x.mean(axis=0)
+        deviations = x - batch.mean
+        batch.comoment = deviations.T @ deviations
+        self.merge(batch)
+
+    def merge(self, other):
+        """ adds the observations summarized by another accumulator to this accumulator """
+
+        if other.n == 0:
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.comoment = self.comoment + other.comoment + np.outer(delta, delta) * (self.n * other.n / n)
+        self.mean = self.mean + delta * (other.n / n)
+        self.n = n
+
+    def get_variance(self):
+        """ :return: sample variance of each column """
+        return np.diag(self.comoment) / (self.n - 1)
+
+    def get_covariance(self):
+        """ :return: sample covariance matrix of the columns """
+        return self.comoment / (self.n - 1)
+
+    def get_t_ci(self, alpha=0.05):
+        """ :return: (lower, upper) arrays of the t-based confidence intervals of the column means """
+        half_width = stats.t.ppf(1 - alpha / 2, self.n - 1) * np.sqrt(self.get_variance() / self.n)
+        return self.mean - half_width, self.mean + half_width
+
+
+class QuantileSketch:
+    """ mergeable quantile sketch of several columns of observations
+    keeps levels of sorted samples where an item of level i stands for 2^i observations; when a level is full,
+    every other item of each column (alternating between even and odd positions) is promoted to the next level.
+    memory grows with the logarithm of the number of observations and two sketches can be merged """
+
+    def __init__(self, n_columns, capacity=4096):
+        """
+        :param n_columns: number of columns (variables) of each observation
+        :param capacity: number of items a level holds before it is compacted (larger is more accurate)
+        """
+        self.nColumns = n_columns
+        self.capacity = capacity
+        self.levels = []        # list of arrays of shape (number of items, number of columns)
+        self._offsets = []      # position (0 or 1) of the items to promote at the next compaction of each level
+
+    def add(self, x):
+        """
+        :param x: (numpy.array) of shape (number of observations, number of columns)
+        """
+        self._add_to_level(0, np.asarray(x, dtype=float))
+
+    def merge(self, other):
+        """ adds the observations summarized by another sketch to this sketch """
+        for level, items in enumerate(other.levels):
+            self._add_to_level(level, items)
+
+    def _add_to_level(self, level, items):
+
+        while len(self.levels) <= level:
+            self.levels.append(np.empty((0, self.nColumns)))
+            self._offsets.append(0)
+
+        self.levels[level] = np.concatenate([self.levels[level], items])
+
+        # compact this level (and then the next ones) while they are full
+        while level < len(self.levels) and len(self.levels[level]) >= self.capacity:
+            items = np.sort(self.levels[level], axis=0)
+            n_pairs = len(items) // 2
+            promoted = items[self._offsets[level]:2 * n_pairs:2]
+            self._offsets[level] = 1 - self._offsets[level]
+            # an unpaired item stays on this level
+            self.levels[level] = items[2 * n_pairs:]
+
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty((0, self.nColumns)))
+                self._offsets.append(0)
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def get_quantiles(self, q):
+        """
+        :param q: (float or list) quantiles in [0, 1]
+        :return: (numpy.array) of shape (number of quantiles, number of columns)
+        """
+
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level_items), 2.0 ** level)
+                                  for level, level_items in enumerate(self.levels)])
+
+        order = np.argsort(items, axis=0)
+        cum_weights = np.cumsum(weights[order], axis=0)
+        total_weight = cum_weights[-1, 0]
+
+        q = np.atleast_1d(q)
+        quantiles = np.empty((len(q), self.nColumns))
+        for j in range(self.nColumns):
+            positions = np.searchsorted(cum_weights[:, j], q * total_weight, side='left')
+            quantiles[:, j] = items[order[np.minimum(positions, len(items) - 1), j], j]
+        return quantiles
+
+
+class PSAAccumulator:
+    """ constant-memory summary of PSA outputs of the decision tree
+    tracks the cost and effect of each strategy, and the incremental cost and effect of each strategy with
+    respect to the base strategy (the first one), without storing the draws """
+
+    def __init__(self, n_strategies=len(STRATEGIES), capacity=4096):
+        """
+        :param n_strategies: number of strategies (outputs have the costs of all strategies followed by their effects)
+        :param capacity: capacity of the levels of the quantile sketch
+        """
+        self.nStrategies = n_strategies
+        # columns: costs, effects, incremental costs and incremental effects of strategies 1, 2, ...
+        n_columns = 4 * n_strategies - 2
+        self.moments = MomentAccumulator(n_columns)
+        self.quantiles = QuantileSketch(n_columns, capacity)
+
+    def add(self, outputs):
+        """
+        :param outputs: (numpy.array) of shape (number of draws, 2 * number of strategies) as returned by
+        DecisionTree2.simulate_decision_tree_batch
+        """
+        n = self.nStrategies
+        outputs = np.asarray(outputs, dtype=float)
+        x = np.concatenate([outputs,
+                            outputs[:, 1:n] - outputs[:, [0]],
+                            outputs[:, n + 1:] - outputs[:, [n]]], axis=1)
+        self.moments.add(x)
+        self.quantiles.add(x)
+
+    def merge(self, other):
+        """ adds the draws summarized by another accumulator (e.g. of another chunk) to this accumulator """
+        self.moments.merge(other.moments)
+        self.quantiles.merge(other.quantiles)
+
+    def get_n(self):
+        """ :return: number of draws """
+        return self.moments.n
+
+    def _get_columns(self, i, incremental):
+        """ :return: (cost column, effect column) of strategy i (or of its incremental cost and effect) """
+        n = self.nStrategies
+        if incremental:
+            return 2 * n + i - 1, 3 * n + i - 2
+        return i, n + i
+
+    def get_summary(self, i, incremental=False, alpha=0.05):
+        """
+        :param i: index of the strategy
+        :param incremental: set to True for the cost and effect with respect to the base strategy
+        :param alpha: significance level
+        :return: dictionary with keys 'cost' and 'effect', each a dictionary with keys 'mean', 'variance',
+        't_ci' (confidence interval of the mean) and 'percentile_interval', and 'covariance' (of cost and effect)
+        """
+
+        if incremental and i == 0:
+            raise ValueError('The base strategy has no incremental cost and effect.')
+
+        cost_col, effect_col = self._get_columns(i, incremental)
+        t_l, t_u = self.moments.get_t_ci(alpha)
+        percentiles = self.quantiles.get_quantiles([alpha / 2, 1 - alpha / 2])
+        variances = self.moments.get_variance()
+
+        summary = {}
+        for key, col in (('cost', cost_col), ('effect', effect_col)):
+            summary[key] = {'mean': self.moments.mean[col],
+                            'variance': variances[col],
+                            't_ci': (t_l[col], t_u[col]),
+                            'percentile_interval': (percentiles[0, col], percentiles[1, col])}
+        summary['covariance'] = self.moments.get_covariance()[cost_col, effect_col]
+        return summary
+
+    def get_icer_standard_error(self, i):
+        """ :return: (ICER, standard error of the ICER) of strategy i with respect to the base strategy, from the
+        delta method on the means of the (paired) incremental costs and effects """
+
+        cost_col, effect_col = self._get_columns(i, incremental=True)
+        d_cost = self.moments.mean[cost_col]
+        d_effect = self.moments.mean[effect_col]
+        icer = d_cost / d_effect
+
+        covariance = self.moments.get_covariance()
+        variance = (covariance[cost_col, cost_col]
+                    + icer ** 2 * covariance[effect_col, effect_col]
+                    - 2 * icer * covariance[cost_col, effect_col]) / (d_effect ** 2 * self.get_n())
+        return icer, np.sqrt(max(variance, 0))
+
+    def get_icer(self, i, alpha=0.05):
+        """ ICER of strategy i with respect to the base strategy, with a confidence interval from the
+        delta method on the means of the (paired) incremental costs and effects
+        :return: (ICER, (lower, upper))
+        """
+
+        if i == 0:
+            raise ValueError('The base strategy has no incremental cost and effect.')
+
+        icer, standard_error = self.get_icer_standard_error(i)
+        half_width = stats.norm.ppf(1 - alpha / 2) * standard_error
+        return icer, (icer - half_width, icer + half_width)
+
+
+class AcceptabilityCounter:
+    """ counts of the draws in which each strategy has the highest net monetary benefit at some willingness-to-pay
+    values (the probabilities of being cost-effective), which can be merged across chunks """
+
+    def __init__(self, wtps, n_strategies=len(STRATEGIES), health_measure='d'):
+        """
+        :param wtps: willingness-to-pay values
+        :param n_strategies: number of strategies (outputs have the costs of all strategies followed by their effects)
+        :param health_measure: 'u' or 'd' (see DecisionTree2.get_effect_multiplier)
+        """
+
+        self.wtps = np.atleast_1d(np.asarray(wtps, dtype=float))
+        self.nStrategies = n_strategies
+        self.healthMeasure = health_measure
+        self._effectMultiplier = get_effect_multiplier(health_measure)
+        self.n = 0
+        self.counts = np.zeros((n_strategies, len(self.wtps)))
+
+    def add(self, outputs):
+        """
+        :param outputs: (numpy.array) of shape (number of draws, 2 * number of strategies) as returned by
+        DecisionTree2.simulate_decision_tree_batch
+        """
+        n = self.nStrategies
+        outputs = np.asarray(outputs, dtype=float)
+        # net monetary benefit of shape (draws, strategies, wtp values)
+        nmb = self._effectMultiplier * outputs[:, n:, np.newaxis] * self.wtps - outputs[:, :n, np.newaxis]
+        optimal = np.argmax(nmb, axis=1)
+        for s in range(n):
+            self.counts[s] += np.count_nonzero(optimal == s, axis=0)
+        self.n += len(outputs)
+
+    def merge(self, other):
+        """ adds the counts of another counter (with the same willingness-to-pay values and health measure) to this
+        counter """
+        self.counts = self.counts + other.counts
+        self.n += other.n
+
+    def get_probabilities(self):
+        """ :return: (numpy.array) of shape (number of strategies, number of wtp values) """
+        return self.counts / self.n
@@ -0,0 +1,171 @@
+import itertools
+
+import numpy as np
+import DecisionTree2 as Tree
+import StrategyModel
+
+CHUNK_SIZE = 2**15  # number of draws processed at once
+
+
+class AllocationProblem:
+    """ optimal assignment of treatments to the strata of a StrategyModel for each PSA draw
+    the cost and hospitalizations of an allocation are sums over strata, so without a budget each stratum gets its
+    best treatment independently; with a budget on treatment spending, the strata are split into two halves and,
+    for each allocation of the first half, the best affordable allocation of the second half is found from the
+    allocations of the second half sorted by spending (exact, and vectorized over draws) """
+
+    def __init__(self, params=None, model=None):
+        """
+        :param params: dictionary of parameter draws with InputData parameter names as dictionary keys
+            (e.g. from PSA.run_psa; InputData values are used if None)
+        :param model: StrategyModel.StrategyModel with the strata and treatments (the default one if None)
+        """
+
+        self.model = model if model is not None else StrategyModel.StrategyModel()
+        self.nStrata = len(self.model.strata)
+        self.nTreatments = len(self.model.treatments)
+
+        params = params or {}
+        names = list(params)
+        values = np.broadcast_arrays(*[np.atleast_1d(np.asarray(params[name], dtype=float)) for name in names])
+        p = Tree.get_parameters(**dict(zip(names, values)))
+
+        shape = (-1, self.nStrata, self.nTreatments)
+        costs, hospitalizations = self.model.get_stratum_outcomes(p)
+        # cost and hospitalizations of each (stratum, treatment) pair per person, of shape (draws, strata, treatments)
+        # (without the overrides of the strategies of the model)
+        n_pairs = self.nStrata * self.nTreatments
+        self.costs = costs[:, :n_pairs].reshape(shape)
+        self.hospitalizations = hospitalizations[:, :n_pairs].reshape(shape)
+
+        # spending on treatments of each (stratum, treatment) pair per person
+        spending = [np.atleast_1d(stratum.get_probability(p) * treatment.get_cost(p))
+                    for stratum in self.model.strata for treatment in self.model.treatments]
+        self.spending = np.stack(np.broadcast_arrays(*spending), axis=1).reshape(shape)
+
+    def get_objective(self, wtp=None):
+        """ :return: (numpy.array) of shape (draws, strata, treatments) of the quantity to minimize:
+        hospitalizations if wtp is None, otherwise the negative net monetary benefit wtp * hospitalizations + cost
+        (with hospitalizations averted as the health outcome) """
+        if wtp is None:
+            return self.hospitalizations
+        return wtp * self.hospitalizations + self.costs
+
+    def solve(self, wtp=None, budget=None, expected=False):
+        """
+        :param wtp: willingness-to-pay per hospitalization averted (if None, hospitalizations are minimized)
+        :param budget: maximum spending on treatments per person (no limit if None)
+        :param expected: set to True to find the allocation that is optimal for the expected outcomes
+            (the mean over draws) instead of the allocation that is optimal for each draw
+        :return: (numpy.array) of shape (draws, strata) (or (1, strata) if expected) with the index of the
+        treatment of each stratum
+        """
+
+        if budget is not None and budget < 0:
+            raise ValueError('The budget should not be negative.')
+
+        objective = self.get_objective(wtp)
+        spending = self.spending
+        if expected:
+            objective = objective.mean(axis=0, keepdims=True)
+            spending = spending.mean(axis=0, keepdims=True)
+
+        if budget is None:
+            # each stratum gets its best treatment
+            return np.argmin(objective, axis=2)
+
+        allocations = np.empty((len(objective), self.nStrata), dtype=int)
+        fixed_spending = len(spending) == 1 or np.all(spending == spending[0])
+        for start in range(0, len(objective), CHUNK_SIZE):
+            end = min(start + CHUNK_SIZE, len(objective))
+            if fixed_spending:
+                allocations[start:end] = self._solve_split(objective[start:end], spending[0], budget)
+            else:
+                allocations[start:end] = self._solve_enumeration(objective[start:end], spending[start:end], budget)
+        return allocations
+
+    def _get_allocations(self, strata):
+        """
+        :param strata: (numpy.array) indices of the strata
+        :return: (all allocations of the strata as a numpy.array of shape (number of allocations, len(strata)),
+        (allocations x (strata x treatments)) matrix with 1 where an allocation assigns the treatment to the stratum)
+        """
+
+        allocations = np.array(list(itertools.product(range(self.nTreatments), repeat=len(strata))), dtype=int)
+        matrix = np.zeros((len(allocations), self.nStrata * self.nTreatments))
+        np.put_along_axis(matrix, strata * self.nTreatments + allocations, 1, axis=1)
+        return allocations, matrix
+
+    def _solve_split(self, objective, spending, budget):
+        """ exact solution when the spending of each (stratum, treatment) pair is the same for all draws """
+
+        allocations_1, matrix_1 = self._get_allocations(np.arange(self.nStrata // 2))
+        allocations_2, matrix_2 = self._get_allocations(np.arange(self.nStrata // 2, self.nStrata))
+        objective = objective.reshape(len(objective), -1)
+
+        spending_1 = matrix_1 @ spending.ravel()
+        spending_2 = matrix_2 @ spending.ravel()
+        # (a small tolerance so that allocations that spend exactly the budget are not lost to round-off)
+        limit = budget + 1e-9 * max(1.0, abs(budget))
+
+        # allocations of the second half sorted by spending, and the number that are affordable after each
+        # allocation of the first half
+        order = np.argsort(spending_2, kind='stable')
+        n_affordable = np.searchsorted(spending_2[order], limit - spending_1, side='right')
+
+        objective_1 = objective @ matrix_1.T
+        objective_2 = objective @ matrix_2[order].T
+
+        # best objective among the cheapest j + 1 allocations of the second half
+        prefix_min = np.minimum.accumulate(objective_2, axis=1)
+        totals = np.where(n_affordable > 0,
+                          objective_1 + prefix_min[:, np.maximum(n_affordable - 1, 0)], np.inf)
+        best_1 = np.argmin(totals, axis=1)
+
+        # best affordable allocation of the second half given the best allocation of the first half
+        affordable = np.arange(len(order)) < n_affordable[best_1][:, np.newaxis]
+        best_2 = order[np.argmin(np.where(affordable, objective_2, np.inf), axis=1)]
+
+        return np.concatenate([allocations_1[best_1], allocations_2[best_2]], axis=1)
+
+    def _solve_enumeration(self, objective, spending, budget, chunk_size=2**10):
+        """ exact solution by enumerating all allocations (when the spending differs between draws) """
+
+        allocations, matrix = self._get_allocations(np.arange(self.nStrata))
+        limit = budget + 1e-9 * max(1.0, abs(budget))
+
+        best = np.empty(len(objective), dtype=int)
+        for start in range(0, len(objective), chunk_size):
+            end = min(start + chunk_size, len(objective))
+            totals = objective[start:end].reshape(end - start, -1) @ matrix.T
+            totals[spending[start:end].reshape(end - start, -1) @ matrix.T > limit] = np.inf
+            best[start:end] = np.argmin(totals, axis=1)
+        return allocations[best]
+
+    def get_summary(self, wtp=None, budget=None):
+        """
+        :param wtp: willingness-to-pay per hospitalization averted (if None, hospitalizations are minimized)
+        :param budget: maximum spending on treatments per person (no limit if None)
+        :return: dictionary with keys
+            'allocation': dictionary of treatment names with stratum names as keys of the allocation that is optimal
+                for the expected outcomes,
+            'probability_optimal': fraction of draws in which this allocation is also optimal,
+            'treatment_probabilities': numpy.array of shape (strata, treatments) with the fraction of draws in which
+                each treatment is optimal for each stratum,
+            'cost', 'hospitalizations' and 'spending': expected cost, hospitalizations and treatment spending
+                per person of the allocation
+        """
+
+        best = self.solve(wtp, budget, expected=True)[0]
+        per_draw = self.solve(wtp, budget)
+
+        strata = np.arange(self.nStrata)
+        treatment_probabilities = np.stack([np.mean(per_draw == t, axis=0) for t in range(self.nTreatments)], axis=1)
+
+        return {'allocation': {stratum.name: self.model.treatments[t].name
+                               for stratum, t in zip(self.model.strata, best)},
+                'probability_optimal': np.mean(np.all(per_draw == best, axis=1)),
+                'treatment_probabilities': treatment_probabilities,
+                'cost': self.costs[:, strata, best].sum(axis=1).mean(),
+                'hospitalizations': self.hospitalizations[:, strata, best].sum(axis=1).mean(),
+                'spending': self.spending[:, strata, best].sum(axis=1).mean()}
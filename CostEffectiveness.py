@@ -0,0 +1,273 @@
+import csv
+import math
+
+import numpy as np
+from scipy import stats
+from DecisionTree2 import get_effect_multiplier
+
+STRATEGY_NAMES = ['Baseline', 'High Risk and Unvax', 'High Risk', 'High Risk and Low Risk Unvax', 'Everyone']
+WTP_GRID = np.linspace(0, 500000, 501)  # willingness-to-pay values ($ per unit of effect)
+
+
+def format_estimate_interval(estimate, interval, digits):
+    """ :return: text in the form 'estimate (l, u)' with thousands separators and the specified decimal places """
+    text = '{:,.{prec}f}'.format(estimate, prec=digits)
+    if interval is None:
+        return text
+    return text + ' ({:,.{prec}f}, {:,.{prec}f})'.format(interval[0], interval[1], prec=digits)
+
+
+def write_table(table, file_name):
+    """ writes the rows of a table to a csv file """
+    with open(file_name, 'w', newline='') as file:
+        csv.writer(file).writerows(table)
+
+
+class CEA:
+    """ cost-effectiveness analysis on arrays of PSA outputs
+    (same frontier, incremental outcomes and table as deampy.econ_eval.CEA, with the calculations over draws,
+    strategies and willingness-to-pay values done on whole arrays) """
+
+    def __init__(self, costs, effects, names=STRATEGY_NAMES, if_paired=False, health_measure='d'):
+        """
+        :param costs: (numpy.array) of shape (number of draws, number of strategies)
+        :param effects: (numpy.array) of shape (number of draws, number of strategies)
+        :param names: (list) names of the strategies (the first strategy is the base strategy)
+        :param if_paired: set to True if the draws of different strategies are paired
+        :param health_measure: 'u' or 'd' (see DecisionTree2.get_effect_multiplier; CETable_base.csv and
+            CETable_PSA.csv were published with 'u')
+        """
+
+        # one contiguous row per strategy, so means are summed in the same order as for a single array
+        self.costs = np.ascontiguousarray(np.asarray(costs, dtype=float).T)
+        self.effects = np.ascontiguousarray(np.asarray(effects, dtype=float).T)
+        self.names = list(names)
+        self.ifPaired = if_paired
+        self.healthMeasure = health_measure
+        self._effectMultiplier = get_effect_multiplier(health_measure)
+
+        self.meanCosts = np.array([np.mean(c) for c in self.costs])
+        self.meanEffects = np.array([np.mean(e) for e in self.effects])
+        # cost and effect with respect to the base strategy (effect as health gained)
+        self.dCosts = self.meanCosts - self.meanCosts[0]
+        self.dEffects = (self.meanEffects - self.meanEffects[0]) * self._effectMultiplier
+
+        self.ifDominated = np.zeros(len(self.names), dtype=bool)
+        self.frontier = []      # indices of strategies on the frontier, by increasing effect
+        self._find_frontier()
+
+    def _find_frontier(self):
+        """ finds the strategies that are not strictly or extendedly dominated """
+
+        n = len(self.names)
+        dominated = self.ifDominated
+
+        # strict dominance: a strategy that yields less health than another but costs at least as much
+        by_effect = sorted(range(n), key=lambda i: self.dEffects[i])
+        for a, i in enumerate(by_effect):
+            for j in by_effect[a + 1:]:
+                if self.dCosts[i] >= self.dCosts[j]:
+                    dominated[i] = True
+                    break
+
+        # strict dominance: a strategy that costs more than another but yields no more health
+        selected = sorted([i for i in by_effect if not dominated[i]], key=lambda i: self.dCosts[i], reverse=True)
+        for a, i in enumerate(selected):
+            for j in selected[a + 1:]:
+                if self.dEffects[i] <= self.dEffects[j]:
+                    dominated[i] = True
+                    break
+
+        # extended dominance: a strategy above the line connecting two other strategies
+        selected = [i for i in by_effect if not dominated[i]]
+        for a, i in enumerate(selected):
+            for j in selected[a + 1:]:
+                v_i_to_j = (self.dEffects[j] - self.dEffects[i], self.dCosts[j] - self.dCosts[i])
+                for k in selected:
+                    if self.dEffects[i] < self.dEffects[k] < self.dEffects[j]:
+                        v_i_to_k = (self.dEffects[k] - self.dEffects[i], self.dCosts[k] - self.dCosts[i])
+                        if v_i_to_j[0] * v_i_to_k[1] - v_i_to_j[1] * v_i_to_k[0] > 0:
+                            dominated[k] = True
+
+        self.frontier = [i for i in by_effect if not dominated[i]]
+
+    def get_icers(self):
+        """ :return: dictionary of ICERs of the strategies on the frontier (except the first) with respect to the
+        previous strategy on the frontier, with strategy names as dictionary keys """
+
+        icers = {}
+        for before, i in zip(self.frontier[:-1], self.frontier[1:]):
+            d_cost = self.meanCosts[i] - self.meanCosts[before]
+            d_effect = (self.meanEffects[i] - self.meanEffects[before]) * self._effectMultiplier
+            icers[self.names[i]] = d_cost / d_effect if d_effect > 0 and d_cost >= 0 else math.nan
+        return icers
+
+    def _get_interval(self, x, interval_type, alpha):
+        """ :return: t-based confidence interval ('c') or percentile interval ('p') of the mean of x """
+
+        if interval_type == 'c':
+            half_length = stats.t.ppf(1 - alpha / 2, len(x) - 1) * np.std(x, ddof=1) / np.sqrt(len(x))
+            mean = np.mean(x)
+            return mean - half_length, mean + half_length
+        elif interval_type == 'p':
+            return tuple(np.percentile(x, [100 * alpha / 2, 100 * (1 - alpha / 2)]))
+        return None
+
+    def _get_difference_interval(self, x, y_ref, interval_type, alpha):
+        """ :return: interval of the mean difference of x and y_ref """
+
+        if self.ifPaired:
+            return self._get_interval(x - y_ref, interval_type, alpha)
+
+        if interval_type == 'c':
+            # Welch's t-interval of independent means (deampy evaluates this interval at alpha/100;
+            # the same is done here so that the tables agree)
+            alpha = alpha / 100
+            var_x = np.var(x) / len(x)
+            var_y = np.var(y_ref) / len(y_ref)
+            df = round((var_x + var_y) ** 2 / (var_x ** 2 / (len(x) - 1) + var_y ** 2 / (len(y_ref) - 1)), 0)
+            half_length = stats.t.ppf(1 - alpha / 2, df) * math.sqrt(var_x + var_y)
+            diff = np.mean(x) - np.mean(y_ref)
+            return diff - half_length, diff + half_length
+        elif interval_type == 'p':
+            # differences of independently shuffled observations
+            rng = np.random.default_rng(1)
+            return self._get_interval(rng.permutation(x) - rng.permutation(y_ref), 'p', alpha)
+        return None
+
+    def get_bootstrap_means(self, n_bootstrap=1000, seed=1, max_chunk_elements=2**24):
+        """ bootstrap means of the costs and effects of all strategies
+        (draws are resampled jointly for all strategies if paired and independently otherwise)
+        :param n_bootstrap: number of bootstrap samples
+        :param seed: seed of the random number generator
+        :param max_chunk_elements: bootstrap samples are drawn in chunks of at most this many resampled indices
+        :return: (mean costs, mean effects), each of shape (n_bootstrap, number of strategies)
+        """
+
+        rng = np.random.default_rng(seed)
+        n_strategies, n_draws = self.costs.shape
+        mean_costs = np.empty((n_bootstrap, n_strategies))
+        mean_effects = np.empty((n_bootstrap, n_strategies))
+
+        chunk_size = max(1, max_chunk_elements // n_draws)
+        for start in range(0, n_bootstrap, chunk_size):
+            end = min(start + chunk_size, n_bootstrap)
+            if self.ifPaired:
+                indices = rng.integers(0, n_draws, size=(end - start, n_draws))
+                for s in range(n_strategies):
+                    mean_costs[start:end, s] = self.costs[s][indices].mean(axis=1)
+                    mean_effects[start:end, s] = self.effects[s][indices].mean(axis=1)
+            else:
+                for s in range(n_strategies):
+                    indices = rng.integers(0, n_draws, size=(end - start, n_draws))
+                    mean_costs[start:end, s] = self.costs[s][indices].mean(axis=1)
+                    mean_effects[start:end, s] = self.effects[s][indices].mean(axis=1)
+
+        return mean_costs, mean_effects
+
+    def get_icer_cis(self, alpha=0.05, n_bootstrap=1000, seed=1):
+        """ bootstrap confidence intervals of the ICERs of the strategies on the frontier
+        :return: dictionary of (lower, upper) with strategy names as dictionary keys
+        (nan if the incremental effect of a bootstrap sample is not positive)
+        """
+
+        mean_costs, mean_effects = self.get_bootstrap_means(n_bootstrap, seed)
+
+        cis = {}
+        for before, i in zip(self.frontier[:-1], self.frontier[1:]):
+            d_costs = mean_costs[:, i] - mean_costs[:, before]
+            d_effects = (mean_effects[:, i] - mean_effects[:, before]) * self._effectMultiplier
+            if np.any(d_effects <= 0):
+                cis[self.names[i]] = (math.nan, math.nan)
+            else:
+                cis[self.names[i]] = tuple(np.percentile(d_costs / d_effects,
+                                                         [100 * alpha / 2, 100 * (1 - alpha / 2)]))
+        return cis
+
+    def build_ce_table(self, interval_type='c', alpha=0.05, cost_digits=0, effect_digits=2, icer_digits=1,
+                       n_bootstrap=1000, seed=1, file_name=None):
+        """
+        :param interval_type: 'n' for no interval, 'c' for confidence interval and 'p' for percentile interval
+            of costs and effects (ICERs always have a bootstrap confidence interval)
+        :param alpha: significance level
+        :param cost_digits: digits to round cost estimates to
+        :param effect_digits: digits to round effect estimates to
+        :param icer_digits: digits to round ICER estimates to
+        :param n_bootstrap: number of bootstrap samples for the confidence intervals of ICERs
+        :param seed: seed of the bootstrap
+        :param file_name: name of the csv file to write the table to (not written if None)
+        :return: (list) rows of the table, starting with the header, with strategies sorted by cost
+        """
+
+        icers = self.get_icers()
+        icer_cis = self.get_icer_cis(alpha, n_bootstrap, seed) if interval_type != 'n' else {}
+        previous = dict(zip(self.frontier[1:], self.frontier[:-1]))
+
+        table = [['Strategy', 'Cost', 'Effect', 'Incremental Cost', 'Incremental Effect', 'ICER']]
+        for i in sorted(range(len(self.names)), key=lambda s: self.dCosts[s]):
+            row = [self.names[i],
+                   format_estimate_interval(self.meanCosts[i],
+                                            self._get_interval(self.costs[i], interval_type, alpha), cost_digits),
+                   format_estimate_interval(self.meanEffects[i],
+                                            self._get_interval(self.effects[i], interval_type, alpha), effect_digits)]
+
+            if i in previous:
+                before = previous[i]
+                effect_new, effect_before = (self.effects[i], self.effects[before]) if self.healthMeasure == 'u' \
+                    else (self.effects[before], self.effects[i])
+                row.append(format_estimate_interval(
+                    self.meanCosts[i] - self.meanCosts[before],
+                    self._get_difference_interval(self.costs[i], self.costs[before], interval_type, alpha),
+                    cost_digits))
+                row.append(format_estimate_interval(
+                    (self.meanEffects[i] - self.meanEffects[before]) * self._effectMultiplier,
+                    self._get_difference_interval(effect_new, effect_before, interval_type, alpha),
+                    effect_digits))
+            else:
+                row.extend(['-', '-'])
+
+            if self.ifDominated[i]:
+                row.append('Dominated')
+            elif i in previous:
+                row.append(format_estimate_interval(icers[self.names[i]], icer_cis.get(self.names[i]), icer_digits))
+            else:
+                row.append('-')
+
+            table.append(row)
+
+        if file_name is not None:
+            write_table(table, file_name)
+
+        return table
+
+    def get_nmb(self, wtps=WTP_GRID):
+        """
+        :param wtps: willingness-to-pay values
+        :return: (numpy.array) of shape (number of strategies, number of wtp values) of expected net monetary benefit
+        """
+        wtps = np.asarray(wtps, dtype=float)
+        return np.outer(self.meanEffects * self._effectMultiplier, wtps) - self.meanCosts[:, np.newaxis]
+
+    def get_acceptability_curves(self, wtps=WTP_GRID, max_chunk_elements=2**24):
+        """ cost-effectiveness acceptability curves: the probability that each strategy has the highest
+        net monetary benefit, from the net monetary benefit of every draw, strategy and wtp value at once
+        :param wtps: willingness-to-pay values
+        :param max_chunk_elements: draws are processed in chunks of at most this many net monetary benefits
+        :return: (numpy.array) of shape (number of strategies, number of wtp values)
+        """
+
+        wtps = np.asarray(wtps, dtype=float)
+        n_strategies, n_draws = self.costs.shape
+        counts = np.zeros((n_strategies, len(wtps)))
+
+        chunk_size = max(1, max_chunk_elements // (n_strategies * len(wtps)))
+        for start in range(0, n_draws, chunk_size):
+            end = min(start + chunk_size, n_draws)
+            # net monetary benefit of shape (strategies, draws, wtp values)
+            nmb = (self.effects[:, start:end, np.newaxis] * self._effectMultiplier * wtps
+                   - self.costs[:, start:end, np.newaxis])
+            optimal = np.argmax(nmb, axis=0)
+            for s in range(n_strategies):
+                counts[s] += np.count_nonzero(optimal == s, axis=0)
+
+        return counts / n_draws
@@ -1,4 +1,9 @@
+from functools import lru_cache
+
+import numpy as np
 import InputData as D
+
+
 class Node:
     """ base (master) class for nodes """
     def __init__(self, name, cost, health_utility):
@@ -11,14 +16,75 @@ class Node:
         self.name = name
         self.cost = cost
         self.healthUtility = health_utility
+        self.parents = None     # nodes that have this node as a future node (None until the tree is linked)
 
-    def get_expected_cost(self):
+    def get_expected_values(self):
         """ abstract method to be overridden in derived classes
-        :returns expected cost of this node """
+        :returns (expected cost, expected health utility) of this node """
+
+    def get_expected_cost(self):
+        """ :returns expected cost of this node """
+        return self.get_expected_values()[0]
 
     def get_expected_health_utility(self):
-        """ abstract method to be overridden in derived classes
-        :returns expected health utility of this node """
+        """ :returns expected health utility of this node """
+        return self.get_expected_values()[1]
+
+    def update(self, cost=None, health_utility=None):
+        """ changes the cost and/or the health utility of visiting this node
+        (use this instead of assigning the attributes so that the cached expected values are recalculated)
+        :param cost: new cost of visiting this node (unchanged if None)
+        :param health_utility: new health utility of visiting this node (unchanged if None)
+        """
+        if cost is not None:
+            self.cost = cost
+        if health_utility is not None:
+            self.healthUtility = health_utility
+        self.invalidate()
+
+    def link_parents(self):
+        """ registers every node of the tree below this node as a parent of its future nodes
+        (chance nodes of a linked tree cache their expected values and update() marks the cached values of the
+        nodes leading to an updated node as dirty; trees that are not linked calculate expected values directly,
+        which is faster when a tree is evaluated only once) """
+
+        if self.parents is None:
+            self.parents = []
+
+        nodes = [self]
+        linked = {id(self)}
+        while len(nodes) > 0:
+            node = nodes.pop()
+            # True if the cached expected values of this node need to be recalculated
+            node.ifDirty = isinstance(node, ChanceNode)
+            for child in CompiledTree._get_future_nodes(node):
+                if child.parents is None:
+                    child.parents = []
+                if node not in child.parents:
+                    child.parents.append(node)
+                if id(child) not in linked:
+                    linked.add(id(child))
+                    nodes.append(child)
+
+    def invalidate(self):
+        """ marks the cached expected values of this node and of all nodes leading to it as dirty
+        (nothing is cached in trees that are not linked, see link_parents) """
+
+        if self.parents is None:
+            return
+
+        nodes = [self]
+        while len(nodes) > 0:
+            node = nodes.pop()
+            for parent in node.parents:
+                # a dirty node only has dirty parents, so the propagation stops there
+                # (only chance nodes cache their expected values)
+                if not parent.ifDirty:
+                    parent.ifDirty = isinstance(parent, ChanceNode)
+                    nodes.append(parent)
+
+        if isinstance(self, ChanceNode):
+            self.ifDirty = True
 
 
 class ChanceNode(Node):
@@ -35,39 +101,50 @@ class ChanceNode(Node):
         self.futureNodes = future_nodes
         self.probs = probs
 
-    def get_expected_cost(self):
+    def update(self, cost=None, health_utility=None, probs=None):
+        """ changes the cost, health utility and/or probabilities of future nodes of this node
+        (use this instead of assigning the attributes so that the cached expected values are recalculated)
+        :param probs: (list) new probability of future nodes (unchanged if None)
+        """
+        if probs is not None:
+            self.probs = probs
+        Node.update(self, cost=cost, health_utility=health_utility)
+
+    def get_expected_values(self):
         """
-        :return: expected cost of this chance node
+        :return: (expected cost, expected health utility) of this chance node
         E[cost] = (cost of visiting this node)
                   + sum_{i}(probability of future node i)*(E[cost of future node i])
+        E[health utility] = (health utility of visiting this node)
+                  + sum_{i}(probability of future node i)*(E[health utility of future node i])
+        (in a linked tree, they are calculated when first requested and then cached, see Node.link_parents)
         """
 
+        # expected values cached in a linked tree
+        if self.parents is not None and not self.ifDirty:
+            return self._expCost, self._expHealthUtility
+
         # expected cost initialized with the cost of visiting the current node
         exp_cost = self.cost
+        exp_health_utility = self.healthUtility
 
-        # go over all future nodes
+        # go over all future nodes (future nodes of a linked tree that are not dirty return their cached values)
         i = 0
         for node in self.futureNodes:
+            node_cost, node_health_utility = node.get_expected_values()
             # increment expected cost by
             # (probability of visiting this future node) * (expected cost of this future node)
-            exp_cost += self.probs[i]*node.get_expected_cost()
+            # (not +=, which would modify the cost array of this node in place when evaluating a batch of draws)
+            exp_cost = exp_cost + self.probs[i]*node_cost
+            exp_health_utility = exp_health_utility + self.probs[i]*node_health_utility
             i += 1
 
-        return exp_cost
-
-    def get_expected_health_utility(self):
-        """
-        :return: expected health utility of this chance node
-        E[health utility] = (health utility of visiting this node)
-                  + sum_{i}(probability of future node i)*(E[health utility of future node i])
-        """
-        exp_health_utility = self.healthUtility
-        i = 0
-        for node in self.futureNodes:
-            exp_health_utility += self.probs[i]*node.get_expected_health_utility()
-            i += 1
+        if self.parents is not None:
+            self._expCost = exp_cost
+            self._expHealthUtility = exp_health_utility
+            self.ifDirty = False
 
-        return exp_health_utility
+        return exp_cost, exp_health_utility
 
 
 class TerminalNode(Node):
@@ -80,17 +157,11 @@ class TerminalNode(Node):
 
         Node.__init__(self, name, cost, health_utility)
 
-    def get_expected_cost(self):
-        """
-        :return: cost of this visiting this terminal node
-        """
-        return self.cost
-
-    def get_expected_health_utility(self):
+    def get_expected_values(self):
         """
-        :return: health utility of visiting this terminal node
+        :return: (cost, health utility) of visiting this terminal node
         """
-        return self.healthUtility
+        return self.cost, self.healthUtility
 
 
 class DecisionNode(Node):
@@ -106,194 +177,528 @@ class DecisionNode(Node):
         Node.__init__(self, name, cost, health_utility)
         self.futureNode = future_nodes
 
-    def get_expected_cost(self):
-        """ returns the expected costs of future nodes
-        :return: a dictionary of expected costs of future nodes with node names as dictionary keys
+    def get_expected_values(self):
+        """ returns the expected costs and health utilities of future nodes
+        :return: (a dictionary of expected costs of future nodes,
+                  a dictionary of expected health utilities of future nodes) with node names as dictionary keys
         """
 
-        # a dictionary to store the expected cost of future nodes
+        # dictionaries to store the expected cost and health utility of future nodes
         exp_costs = dict()
+        exp_health_utilities = dict()
         # go over all future nodes
         for node in self.futureNode:
-            # add the expected cost of this future node to the dictionary
-            exp_costs[node.name] = self.cost + node.get_expected_cost()
+            # add the expected cost and health utility of this future node to the dictionaries
+            node_cost, node_health_utility = node.get_expected_values()
+            exp_costs[node.name] = self.cost + node_cost
+            exp_health_utilities[node.name] = self.healthUtility + node_health_utility
+
+        return exp_costs, exp_health_utilities
+
+    def compile(self, template=None):
+        """
+        :param template: a CompiledTree of a tree with the same structure, whose structure is reused (see CompiledTree)
+        :return: a CompiledTree of the tree rooted at this decision node
+        (evaluates the expected cost and health utility of every node in one sweep)
+        """
+        return CompiledTree(self, template)
+
+
+class CompiledTree:
+    """ flat, array-backed representation of a tree of nodes
+    nodes are stored in topological order (every node comes after all of its future nodes) and the edges of
+    chance nodes as flat arrays of parent indices, child indices and probabilities, sorted by parent. one linear
+    sweep over the edges then calculates the expected cost and health utility of every node, without recursion.
+    nodes shared by several parents (e.g. terminal nodes) are stored and evaluated only once.
+    the structure (order of the nodes and edges) of a compiled tree can be reused to compile a tree with the same
+    structure, e.g. the same tree built with other parameter values, whose nodes are then found without a traversal.
+    """
+
+    def __init__(self, root, template=None):
+        """
+        :param root: the root node (usually a decision node)
+        :param template: a CompiledTree of a tree with the same structure, whose structure is reused
+            (the tree is compiled from scratch if its structure differs from the structure of the template)
+        """
+
+        self.root = root
+        self.nodes = template._find_nodes(root) if template is not None else None   # nodes in topological order
+
+        if self.nodes is not None:
+            self.futurePositions = template.futurePositions
+            self.edgeParents = template.edgeParents
+            self.edgeChildren = template.edgeChildren
+            self._edges = template._edges
+        else:
+            self._compile()
+
+        self.update()
+
+    def _compile(self):
+        """ finds the nodes of the tree in topological order and the edges of its chance nodes """
+
+        self.nodes = []
+        index = {}     # dictionary of node positions with id(node) as dictionary keys
+
+        # depth-first (post-order) traversal without recursion, so that deep trees compile
+        stack = [(self.root, False)]
+        while len(stack) > 0:
+            node, children_added = stack.pop()
+            if id(node) in index:
+                continue
+            if children_added:
+                index[id(node)] = len(self.nodes)
+                self.nodes.append(node)
+            else:
+                stack.append((node, True))
+                for child in reversed(self._get_future_nodes(node)):
+                    if id(child) not in index:
+                        stack.append((child, False))
+
+        # positions of the future nodes of each node
+        self.futurePositions = [[index[id(child)] for child in self._get_future_nodes(node)] for node in self.nodes]
+
+        # flat edge arrays of chance nodes (sorted by parent; the edges of each parent are kept in the order of
+        # its future nodes, so that the sweep adds up the terms in the same order as ChanceNode)
+        edge_parents = []
+        edge_children = []
+        for i, node in enumerate(self.nodes):
+            if isinstance(node, ChanceNode):
+                for j in self.futurePositions[i]:
+                    edge_parents.append(i)
+                    edge_children.append(j)
+        self.edgeParents = np.array(edge_parents, dtype=int)
+        self.edgeChildren = np.array(edge_children, dtype=int)
+        self._edges = list(zip(edge_parents, edge_children))
+
+    def _find_nodes(self, root):
+        """
+        :param root: the root of a tree
+        :return: the nodes of the tree in the order of the nodes of this compiled tree,
+            or None if the structure of the tree differs
+        """
+
+        nodes = [None] * len(self.nodes)
+        nodes[-1] = root
+        # every node comes after its future nodes, so going backwards places each node before it is reached
+        for i in range(len(nodes) - 1, -1, -1):
+            node = nodes[i]
+            future_nodes = self._get_future_nodes(node)
+            positions = self.futurePositions[i]
+            if type(node) is not type(self.nodes[i]) or node.name != self.nodes[i].name \
+                    or len(future_nodes) != len(positions):
+                return None
+            for child, j in zip(future_nodes, positions):
+                if nodes[j] is None:
+                    nodes[j] = child
+                elif nodes[j] is not child:
+                    return None
+        return nodes
+
+    @staticmethod
+    def _get_future_nodes(node):
+        """ :return: the future nodes of a node """
+        if isinstance(node, ChanceNode):
+            return node.futureNodes
+        elif isinstance(node, DecisionNode):
+            return node.futureNode
+        return []
+
+    def update(self):
+        """ reads the costs, health utilities and probabilities from the nodes again
+        (call after the nodes of the tree are changed) """
+
+        # values are floats, or arrays of draws when the tree is built for a batch of draws
+        self.nodeCosts = [node.cost for node in self.nodes]
+        self.nodeUtilities = [node.healthUtility for node in self.nodes]
+        self.edgeProbs = []
+        for node in self.nodes:
+            if isinstance(node, ChanceNode):
+                self.edgeProbs.extend(node.probs)
+
+        self._expected = None
+
+    def evaluate(self):
+        """
+        :return: (expected costs, expected health utilities) as lists with one entry per node (in the order of
+        self.nodes)
+        E[node] = (value of visiting this node) + sum_{i}(probability of future node i)*(E[future node i])
+        """
+
+        if self._expected is None:
+            # expected values initialized with the values of visiting each node
+            exp_costs = list(self.nodeCosts)
+            exp_utilities = list(self.nodeUtilities)
+
+            # children come before their parents, so each child is complete when its term is added to the parent
+            for (parent, child), prob in zip(self._edges, self.edgeProbs):
+                exp_costs[parent] = exp_costs[parent] + prob * exp_costs[child]
+                exp_utilities[parent] = exp_utilities[parent] + prob * exp_utilities[child]
 
-        return exp_costs
+            self._expected = (exp_costs, exp_utilities)
+
+        return self._expected
+
+    def get_expected_cost(self):
+        """
+        :return: a dictionary of expected costs of the future nodes of the root decision node
+        (with node names as dictionary keys), or the expected cost of the root if it is not a decision node
+        """
+        return self._get_expected(self.evaluate()[0], self.root.cost)
 
     def get_expected_health_utility(self):
-        """ returns the expected health utility of future nodes
-        :return: a dictionary of expected health utility of future nodes with node names as dictionary keys
         """
-        # a dictionary to store the expected health utility of future nodes
-        exp_health_utilities = dict()
-        # go over all future nodes
-        for node in self.futureNode:
-            # add the expected health utility of this future node to the dictionary
-            exp_health_utilities[node.name] = self.healthUtility + node.get_expected_health_utility()
+        :return: a dictionary of expected health utility of the future nodes of the root decision node
+        (with node names as dictionary keys), or the expected health utility of the root if it is not a decision node
+        """
+        return self._get_expected(self.evaluate()[1], self.root.healthUtility)
 
-        return exp_health_utilities
+    def _get_expected(self, exp_values, root_value):
 
+        # the root is the last node
+        if not isinstance(self.root, DecisionNode):
+            return exp_values[-1]
 
-def simulate_decision_tree(drug_cost=D.DRUG_COST, hosp_cost=D.HOSP_COST, relative_risk_vax=D.DRUG_RR_VAX_OR_LR,
-                           relative_risk_unvax=D.DRUG_RR_UNVAX_HR, rr_pax_vax=D.PAXLOVID_RR_VAX_OR_LR, rr_pax_unvax=D.PAXLOVID_RR_UNVAX_HR):
-    T1 = TerminalNode('T1', hosp_cost, 1)
+        exp_values_dict = dict()
+        for node, i in zip(self.root.futureNode, self.futurePositions[-1]):
+            exp_values_dict[node.name] = root_value + exp_values[i]
+        return exp_values_dict
+
+
+# values of the model parameters of InputData, read once (parameters are changed through get_parameters overrides)
+DEFAULT_PARAMETERS = {name: value for name, value in vars(D).items() if name.isupper()}
+
+# names of the arguments of simulate_decision_tree and simulate_decision_tree_batch for the parameters that have one
+ARGUMENT_NAMES = {'DRUG_COST': 'drug_cost',
+                  'HOSP_COST': 'hosp_cost',
+                  'DRUG_RR_VAX_OR_LR': 'relative_risk_vax',
+                  'DRUG_RR_UNVAX_HR': 'relative_risk_unvax',
+                  'PAXLOVID_RR_VAX_OR_LR': 'rr_pax_vax',
+                  'PAXLOVID_RR_UNVAX_HR': 'rr_pax_unvax'}
+
+# names of the allocation strategies, in the order of the outputs of simulate_decision_tree
+STRATEGIES = ['C0', 'C1', 'C2', 'C3', 'C4']
+
+
+def get_effect_multiplier(health_measure):
+    """
+    :param health_measure: 'u' if higher effect implies better health and 'd' if it implies worse health
+        (the effect of the decision tree, its health utility, is the probability of hospitalization, so 'd' is the
+        correct choice for this model and the health outcome is hospitalizations averted)
+    :return: 1 or -1, the factor that turns effects into health gained
+    """
+    if health_measure not in ('u', 'd'):
+        raise ValueError("health_measure should be 'u' or 'd'.")
+    return 1 if health_measure == 'u' else -1
+
+
+class Parameters:
+    """ namespace of model parameters with parameter names as attributes
+    (attributes are set one by one in the same order for every namespace, which makes reading them while building
+    a tree faster than from a types.SimpleNamespace) """
+
+    def __init__(self, values):
+        """
+        :param values: dictionary of parameter values with parameter names as dictionary keys
+        """
+        for name, value in values.items():
+            setattr(self, name, value)
+
+
+def get_parameters(**overrides):
+    """
+    :param overrides: values to use instead of the InputData values, with parameter names as keywords
+    (e.g. DRUG_COST=600); values can be floats or numpy arrays of draws
+    :return: a namespace with all model parameters of InputData as attributes
+    """
+    for name in overrides:
+        if name not in DEFAULT_PARAMETERS:
+            raise ValueError('{} is not a parameter of InputData.'.format(name))
+    return Parameters({**DEFAULT_PARAMETERS, **overrides})
+
+
+def build_decision_tree(p=None):
+    """ builds the decision tree of the five allocation strategies
+    :param p: model parameters as returned by get_parameters (InputData values if None);
+        parameters can be floats or numpy arrays of the same length to build the tree for a batch of draws
+    :return: the decision node with the strategies C0, C1, C2, C3 and C4 as future nodes
+    """
+    if p is None:
+        p = get_parameters()
+
+    T1 = TerminalNode('T1', p.HOSP_COST, 1)
     T2 = TerminalNode('T2', 0, 0)
 
-    VAX_0_0 = ChanceNode(name='VAX_0_0', future_nodes=[T1, T2], probs=[D.HOSP_COMORB_65*D.VAX_HOSP_MULT*rr_pax_vax,
-                                                                       1 - (D.HOSP_COMORB_65*D.VAX_HOSP_MULT*rr_pax_vax)], cost=D.PAXLOVID_COST, health_utility=0)
-    UNVAX_0_0 = ChanceNode(name='UNVAX_0_0', future_nodes=[T1, T2], probs=[D.HOSP_COMORB_65*rr_pax_unvax,
-                                                                           1-(D.HOSP_COMORB_65*rr_pax_unvax)], cost=D.PAXLOVID_COST, health_utility=0)
-    VAX_0_1 = ChanceNode(name='VAX_0_1', future_nodes=[T1, T2], probs=[D.HOSP_NOCOMORB_65*D.VAX_HOSP_MULT*rr_pax_vax,
-                                                                       1-(D.HOSP_NOCOMORB_65*D.VAX_HOSP_MULT*rr_pax_vax)], cost=D.PAXLOVID_COST, health_utility=0)
-    UNVAX_0_1 = ChanceNode(name='UNVAX_0_1', future_nodes=[T1, T2], probs=[D.HOSP_NOCOMORB_65*rr_pax_unvax,
-                                                                           1-(D.HOSP_NOCOMORB_65*rr_pax_unvax)], cost=D.PAXLOVID_COST, health_utility=0)
-    COMORB_0 = ChanceNode(name='COMORB_0', future_nodes=[VAX_0_0, UNVAX_0_0], probs=[D.VAX_OVER_65, 1-D.VAX_OVER_65], cost=0, health_utility=0)
-    NO_COMORB_0 = ChanceNode(name='COMORB_1', future_nodes=[VAX_0_1, UNVAX_0_1], probs=[D.VAX_OVER_65, 1-D.VAX_OVER_65], cost=0, health_utility=0)
-    AGE_OVER_0 = ChanceNode(name='OVER_65_0', future_nodes=[COMORB_0, NO_COMORB_0], probs=[D.HR_65_COMORB, 1-D.HR_65_COMORB], cost=0, health_utility=0)
-
-    VAX_0 = ChanceNode(name='VAX_0', future_nodes=[T1, T2], probs=[D.HOSP_COMORB_UNDER65*D.VAX_HOSP_MULT*rr_pax_vax,
-                                                                   1-(D.HOSP_COMORB_UNDER65*D.VAX_HOSP_MULT*rr_pax_vax)], cost=D.PAXLOVID_COST, health_utility=0)
-    UNVAX_0 = ChanceNode(name='UNVAX_0', future_nodes=[T1, T2], probs=[D.HOSP_COMORB_UNDER65*rr_pax_unvax,
-                                                                       1-(D.HOSP_COMORB_UNDER65*rr_pax_unvax)], cost=D.PAXLOVID_COST, health_utility=0)
-    AGE_UNDER_0 = ChanceNode(name='UNDER_65_0', future_nodes=[VAX_0, UNVAX_0], probs=[D.VAX_UNDER_65, 1-D.VAX_UNDER_65], cost=0, health_utility=0)
-
-    HR_0 = ChanceNode(name='HR_0', future_nodes=[AGE_OVER_0, AGE_UNDER_0], probs=[D.HR_65, 1-D.HR_65], cost=0, health_utility=0)
-
-    VAX_LR_0 = ChanceNode(name='VAX_LR_0', future_nodes=[T1, T2], probs=[D.HOSP_NOCOMORB_UNDER65*D.VAX_HOSP_MULT, 1-(D.HOSP_NOCOMORB_UNDER65*D.VAX_HOSP_MULT)], cost=0, health_utility=0)
-    UNVAX_LR_0 = ChanceNode(name='UNVAX_LR_0', future_nodes=[T1, T2], probs=[D.HOSP_NOCOMORB_UNDER65, 1-D.HOSP_NOCOMORB_UNDER65], cost=0, health_utility=0)
-    LR_0 = ChanceNode('LR_0', future_nodes=[VAX_LR_0, UNVAX_LR_0], probs=[D.VAX_UNDER_65, 1-D.VAX_UNDER_65], cost=0, health_utility=0)
-    C0 = ChanceNode(name='C0', future_nodes=[HR_0, LR_0], probs=[D.HR, 1-D.HR], cost=0, health_utility=0)
+    VAX_0_0 = ChanceNode(name='VAX_0_0', future_nodes=[T1, T2], probs=[p.HOSP_COMORB_65*p.VAX_HOSP_MULT*p.PAXLOVID_RR_VAX_OR_LR,
+                                                                       1 - (p.HOSP_COMORB_65*p.VAX_HOSP_MULT*p.PAXLOVID_RR_VAX_OR_LR)], cost=p.PAXLOVID_COST, health_utility=0)
+    UNVAX_0_0 = ChanceNode(name='UNVAX_0_0', future_nodes=[T1, T2], probs=[p.HOSP_COMORB_65*p.PAXLOVID_RR_UNVAX_HR,
+                                                                           1-(p.HOSP_COMORB_65*p.PAXLOVID_RR_UNVAX_HR)], cost=p.PAXLOVID_COST, health_utility=0)
+    VAX_0_1 = ChanceNode(name='VAX_0_1', future_nodes=[T1, T2], probs=[p.HOSP_NOCOMORB_65*p.VAX_HOSP_MULT*p.PAXLOVID_RR_VAX_OR_LR,
+                                                                       1-(p.HOSP_NOCOMORB_65*p.VAX_HOSP_MULT*p.PAXLOVID_RR_VAX_OR_LR)], cost=p.PAXLOVID_COST, health_utility=0)
+    UNVAX_0_1 = ChanceNode(name='UNVAX_0_1', future_nodes=[T1, T2], probs=[p.HOSP_NOCOMORB_65*p.PAXLOVID_RR_UNVAX_HR,
+                                                                           1-(p.HOSP_NOCOMORB_65*p.PAXLOVID_RR_UNVAX_HR)], cost=p.PAXLOVID_COST, health_utility=0)
+    COMORB_0 = ChanceNode(name='COMORB_0', future_nodes=[VAX_0_0, UNVAX_0_0], probs=[p.VAX_OVER_65, 1-p.VAX_OVER_65], cost=0, health_utility=0)
+    NO_COMORB_0 = ChanceNode(name='NO_COMORB_0', future_nodes=[VAX_0_1, UNVAX_0_1], probs=[p.VAX_OVER_65, 1-p.VAX_OVER_65], cost=0, health_utility=0)
+    AGE_OVER_0 = ChanceNode(name='OVER_65_0', future_nodes=[COMORB_0, NO_COMORB_0], probs=[p.HR_65_COMORB, 1-p.HR_65_COMORB], cost=0, health_utility=0)
+
+    VAX_0 = ChanceNode(name='VAX_0', future_nodes=[T1, T2], probs=[p.HOSP_COMORB_UNDER65*p.VAX_HOSP_MULT*p.PAXLOVID_RR_VAX_OR_LR,
+                                                                   1-(p.HOSP_COMORB_UNDER65*p.VAX_HOSP_MULT*p.PAXLOVID_RR_VAX_OR_LR)], cost=p.PAXLOVID_COST, health_utility=0)
+    UNVAX_0 = ChanceNode(name='UNVAX_0', future_nodes=[T1, T2], probs=[p.HOSP_COMORB_UNDER65*p.PAXLOVID_RR_UNVAX_HR,
+                                                                       1-(p.HOSP_COMORB_UNDER65*p.PAXLOVID_RR_UNVAX_HR)], cost=p.PAXLOVID_COST, health_utility=0)
+    AGE_UNDER_0 = ChanceNode(name='UNDER_65_0', future_nodes=[VAX_0, UNVAX_0], probs=[p.VAX_UNDER_65, 1-p.VAX_UNDER_65], cost=0, health_utility=0)
+
+    HR_0 = ChanceNode(name='HR_0', future_nodes=[AGE_OVER_0, AGE_UNDER_0], probs=[p.HR_65, 1-p.HR_65], cost=0, health_utility=0)
+
+    VAX_LR_0 = ChanceNode(name='VAX_LR_0', future_nodes=[T1, T2], probs=[p.HOSP_NOCOMORB_UNDER65*p.VAX_HOSP_MULT, 1-(p.HOSP_NOCOMORB_UNDER65*p.VAX_HOSP_MULT)], cost=0, health_utility=0)
+    UNVAX_LR_0 = ChanceNode(name='UNVAX_LR_0', future_nodes=[T1, T2], probs=[p.HOSP_NOCOMORB_UNDER65, 1-p.HOSP_NOCOMORB_UNDER65], cost=0, health_utility=0)
+    LR_0 = ChanceNode('LR_0', future_nodes=[VAX_LR_0, UNVAX_LR_0], probs=[p.VAX_UNDER_65, 1-p.VAX_UNDER_65], cost=0, health_utility=0)
+    C0 = ChanceNode(name='C0', future_nodes=[HR_0, LR_0], probs=[p.HR, 1-p.HR], cost=0, health_utility=0)
     # ------------------------------------------------#
 
-    VAX_1_0 = ChanceNode(name='VAX_1_0', future_nodes=[T1, T2], probs=[D.HOSP_COMORB_65*D.VAX_HOSP_MULT,
-                                                                       1-D.HOSP_COMORB_65*D.VAX_HOSP_MULT], cost=0, health_utility=0)
-    UNVAX_1_0 = ChanceNode(name='UNVAX_1_0', future_nodes=[T1, T2], probs=[D.HOSP_COMORB_65*relative_risk_unvax,
-                                                                           1-D.HOSP_COMORB_65*relative_risk_unvax], cost=drug_cost, health_utility=0)
-    COMORB_1 = ChanceNode(name='COMORB_1', future_nodes=[VAX_1_0, UNVAX_1_0], probs=[D.VAX_OVER_65, 1-D.VAX_OVER_65], cost=0, health_utility=0)
-
-    VAX_1_1 = ChanceNode(name='VAX_1_1', future_nodes=[T1, T2], probs=[D.HOSP_NOCOMORB_65*D.VAX_HOSP_MULT,
-                                                                       1-D.HOSP_NOCOMORB_65*D.VAX_HOSP_MULT], cost=0, health_utility=0)
-    UNVAX_1_1 = ChanceNode(name='UNVAX_1_1', future_nodes=[T1, T2], probs=[D.HOSP_NOCOMORB_65*relative_risk_unvax,
-                                                                           1-D.HOSP_NOCOMORB_65*relative_risk_unvax], cost=drug_cost, health_utility=0)
-    NO_COMORB_1 = ChanceNode(name='NO_COMORB_1', future_nodes=[VAX_1_1, UNVAX_1_1], probs=[D.VAX_OVER_65, 1-D.VAX_OVER_65], cost=0, health_utility=0)
-    AGE_OVER_1 = ChanceNode(name='OVER_65_1', future_nodes=[COMORB_1, NO_COMORB_1], probs=[D.HR_65_COMORB, 1-D.HR_65_COMORB], cost=0, health_utility=0)
-
-    VAX_1 = ChanceNode(name='VAX_1', future_nodes=[T1, T2], probs=[D.HOSP_COMORB_UNDER65, 1-D.HOSP_COMORB_UNDER65], cost=0, health_utility=0)
-    UNVAX_1 = ChanceNode(name='UNVAX_1', future_nodes=[T1, T2], probs=[D.HOSP_COMORB_UNDER65*relative_risk_unvax,
-                                                                       1-D.HOSP_COMORB_UNDER65*relative_risk_unvax], cost=drug_cost, health_utility=0)
-    AGE_UNDER_1 = ChanceNode(name='UNDER_65_1', future_nodes=[VAX_1, UNVAX_1], probs=[D.VAX_UNDER_65, 1-D.VAX_UNDER_65], cost=0, health_utility=0)
-    HR_1 = ChanceNode('HR_1', future_nodes=[AGE_OVER_1, AGE_UNDER_1], probs=[D.HR_65, 1-D.HR_65], cost=0, health_utility=0)
-
-    VAX_LR_1 = ChanceNode(name='VAX_LR_1', future_nodes=[T1, T2], probs=[D.HOSP_NOCOMORB_UNDER65 * D.VAX_HOSP_MULT,
-                                                                         1 - (D.HOSP_NOCOMORB_UNDER65 * D.VAX_HOSP_MULT)], cost=0, health_utility=0)
+    VAX_1_0 = ChanceNode(name='VAX_1_0', future_nodes=[T1, T2], probs=[p.HOSP_COMORB_65*p.VAX_HOSP_MULT,
+                                                                       1-p.HOSP_COMORB_65*p.VAX_HOSP_MULT], cost=0, health_utility=0)
+    UNVAX_1_0 = ChanceNode(name='UNVAX_1_0', future_nodes=[T1, T2], probs=[p.HOSP_COMORB_65*p.DRUG_RR_UNVAX_HR,
+                                                                           1-p.HOSP_COMORB_65*p.DRUG_RR_UNVAX_HR], cost=p.DRUG_COST, health_utility=0)
+    COMORB_1 = ChanceNode(name='COMORB_1', future_nodes=[VAX_1_0, UNVAX_1_0], probs=[p.VAX_OVER_65, 1-p.VAX_OVER_65], cost=0, health_utility=0)
+
+    VAX_1_1 = ChanceNode(name='VAX_1_1', future_nodes=[T1, T2], probs=[p.HOSP_NOCOMORB_65*p.VAX_HOSP_MULT,
+                                                                       1-p.HOSP_NOCOMORB_65*p.VAX_HOSP_MULT], cost=0, health_utility=0)
+    UNVAX_1_1 = ChanceNode(name='UNVAX_1_1', future_nodes=[T1, T2], probs=[p.HOSP_NOCOMORB_65*p.DRUG_RR_UNVAX_HR,
+                                                                           1-p.HOSP_NOCOMORB_65*p.DRUG_RR_UNVAX_HR], cost=p.DRUG_COST, health_utility=0)
+    NO_COMORB_1 = ChanceNode(name='NO_COMORB_1', future_nodes=[VAX_1_1, UNVAX_1_1], probs=[p.VAX_OVER_65, 1-p.VAX_OVER_65], cost=0, health_utility=0)
+    AGE_OVER_1 = ChanceNode(name='OVER_65_1', future_nodes=[COMORB_1, NO_COMORB_1], probs=[p.HR_65_COMORB, 1-p.HR_65_COMORB], cost=0, health_utility=0)
+
+    VAX_1 = ChanceNode(name='VAX_1', future_nodes=[T1, T2], probs=[p.HOSP_COMORB_UNDER65, 1-p.HOSP_COMORB_UNDER65], cost=0, health_utility=0)
+    UNVAX_1 = ChanceNode(name='UNVAX_1', future_nodes=[T1, T2], probs=[p.HOSP_COMORB_UNDER65*p.DRUG_RR_UNVAX_HR,
+                                                                       1-p.HOSP_COMORB_UNDER65*p.DRUG_RR_UNVAX_HR], cost=p.DRUG_COST, health_utility=0)
+    AGE_UNDER_1 = ChanceNode(name='UNDER_65_1', future_nodes=[VAX_1, UNVAX_1], probs=[p.VAX_UNDER_65, 1-p.VAX_UNDER_65], cost=0, health_utility=0)
+    HR_1 = ChanceNode('HR_1', future_nodes=[AGE_OVER_1, AGE_UNDER_1], probs=[p.HR_65, 1-p.HR_65], cost=0, health_utility=0)
+
+    VAX_LR_1 = ChanceNode(name='VAX_LR_1', future_nodes=[T1, T2], probs=[p.HOSP_NOCOMORB_UNDER65 * p.VAX_HOSP_MULT,
+                                                                         1 - (p.HOSP_NOCOMORB_UNDER65 * p.VAX_HOSP_MULT)], cost=0, health_utility=0)
     UNVAX_LR_1 = ChanceNode(name='UNVAX_LR_1', future_nodes=[T1, T2],
-                            probs=[D.HOSP_NOCOMORB_UNDER65, 1 - D.HOSP_NOCOMORB_UNDER65], cost=0, health_utility=0)
-    LR_1 = ChanceNode('LR_1', future_nodes=[VAX_LR_1, UNVAX_LR_1], probs=[D.VAX_UNDER_65, 1-D.VAX_UNDER_65], cost=0, health_utility=0)
-    C1 = ChanceNode('C1', 0, [HR_1, LR_1], [D.HR, 1-D.HR], health_utility=0)  # high risk and un-vaccinated
+                            probs=[p.HOSP_NOCOMORB_UNDER65, 1 - p.HOSP_NOCOMORB_UNDER65], cost=0, health_utility=0)
+    LR_1 = ChanceNode('LR_1', future_nodes=[VAX_LR_1, UNVAX_LR_1], probs=[p.VAX_UNDER_65, 1-p.VAX_UNDER_65], cost=0, health_utility=0)
+    C1 = ChanceNode('C1', 0, [HR_1, LR_1], [p.HR, 1-p.HR], health_utility=0)  # high risk and un-vaccinated
 
     # ----------------------------------------------
 
-    VAX_2_0 = ChanceNode('VAX_2_0', drug_cost, [T1, T2], [D.HOSP_COMORB_65*D.VAX_HOSP_MULT*relative_risk_vax,
-                                                  1-D.HOSP_COMORB_65*D.VAX_HOSP_MULT*relative_risk_vax], 0)
-    UNVAX_2_0 = ChanceNode('UNVAX_2_0', drug_cost, [T1, T2], [D.HOSP_COMORB_65*relative_risk_unvax, 1-D.HOSP_COMORB_65*relative_risk_unvax], 0)
-    VAX_2_1 = ChanceNode('VAX_2_1', drug_cost, [T1, T2], [D.HOSP_NOCOMORB_65*D.VAX_HOSP_MULT*relative_risk_vax,
-                                                          1-D.HOSP_NOCOMORB_65*D.VAX_HOSP_MULT*relative_risk_vax], 0)
-    UNVAX_2_1 = ChanceNode('UNVAX_2_1', drug_cost, [T1, T2], [D.HOSP_NOCOMORB_65*relative_risk_unvax, 1-D.HOSP_NOCOMORB_65*relative_risk_unvax], 0)
-    COMORB_2 = ChanceNode(name='COMORB_2', future_nodes=[VAX_2_0, UNVAX_2_0], probs=[D.VAX_OVER_65, 1-D.VAX_OVER_65], cost=0, health_utility=0)
-    NO_COMORB_2 = ChanceNode(name='NO_COMORB_2', future_nodes=[VAX_2_1, UNVAX_2_1], probs=[D.VAX_OVER_65, 1-D.VAX_OVER_65], cost=0, health_utility=0)
-    AGE_OVER_2 = ChanceNode(name='AGE_OVER_2', future_nodes=[COMORB_2, NO_COMORB_2], probs=[D.HR_65_COMORB, 1-D.HR_65_COMORB], cost=0, health_utility=0)
-    VAX_2 = ChanceNode(name='VAX_2', future_nodes=[T1, T2], probs=[D.HOSP_COMORB_UNDER65*relative_risk_vax*D.VAX_HOSP_MULT,
-                                                                   1-D.HOSP_COMORB_UNDER65*relative_risk_vax*D.VAX_HOSP_MULT], cost=drug_cost, health_utility=0)
-    UNVAX_2 = ChanceNode(name='UNVAX_2', future_nodes=[T1, T2], probs=[D.HOSP_COMORB_UNDER65*relative_risk_unvax,
-                                                                       1-D.HOSP_COMORB_UNDER65*relative_risk_unvax], cost=drug_cost, health_utility=0)
-    AGE_UNDER_2 = ChanceNode(name='AGE_UNDER_2', future_nodes=[VAX_2, UNVAX_2], probs=[D.VAX_UNDER_65, 1-D.VAX_UNDER_65], cost=0, health_utility=0)
-    HR_2 = ChanceNode(name='HR_2', future_nodes=[AGE_OVER_2, AGE_UNDER_2], probs=[D.HR_65, 1-D.HR_65], cost=0, health_utility=0)
-
-    VAX_LR_2 = ChanceNode(name='VAX_LR_2', future_nodes=[T1, T2], probs=[D.HOSP_NOCOMORB_UNDER65 * D.VAX_HOSP_MULT,
-                                                                         1 - (D.HOSP_NOCOMORB_UNDER65 * D.VAX_HOSP_MULT)], cost=0, health_utility=0)
+    VAX_2_0 = ChanceNode('VAX_2_0', p.DRUG_COST, [T1, T2], [p.HOSP_COMORB_65*p.VAX_HOSP_MULT*p.DRUG_RR_VAX_OR_LR,
+                                                  1-p.HOSP_COMORB_65*p.VAX_HOSP_MULT*p.DRUG_RR_VAX_OR_LR], 0)
+    UNVAX_2_0 = ChanceNode('UNVAX_2_0', p.DRUG_COST, [T1, T2], [p.HOSP_COMORB_65*p.DRUG_RR_UNVAX_HR, 1-p.HOSP_COMORB_65*p.DRUG_RR_UNVAX_HR], 0)
+    VAX_2_1 = ChanceNode('VAX_2_1', p.DRUG_COST, [T1, T2], [p.HOSP_NOCOMORB_65*p.VAX_HOSP_MULT*p.DRUG_RR_VAX_OR_LR,
+                                                          1-p.HOSP_NOCOMORB_65*p.VAX_HOSP_MULT*p.DRUG_RR_VAX_OR_LR], 0)
+    UNVAX_2_1 = ChanceNode('UNVAX_2_1', p.DRUG_COST, [T1, T2], [p.HOSP_NOCOMORB_65*p.DRUG_RR_UNVAX_HR, 1-p.HOSP_NOCOMORB_65*p.DRUG_RR_UNVAX_HR], 0)
+    COMORB_2 = ChanceNode(name='COMORB_2', future_nodes=[VAX_2_0, UNVAX_2_0], probs=[p.VAX_OVER_65, 1-p.VAX_OVER_65], cost=0, health_utility=0)
+    NO_COMORB_2 = ChanceNode(name='NO_COMORB_2', future_nodes=[VAX_2_1, UNVAX_2_1], probs=[p.VAX_OVER_65, 1-p.VAX_OVER_65], cost=0, health_utility=0)
+    AGE_OVER_2 = ChanceNode(name='AGE_OVER_2', future_nodes=[COMORB_2, NO_COMORB_2], probs=[p.HR_65_COMORB, 1-p.HR_65_COMORB], cost=0, health_utility=0)
+    VAX_2 = ChanceNode(name='VAX_2', future_nodes=[T1, T2], probs=[p.HOSP_COMORB_UNDER65*p.DRUG_RR_VAX_OR_LR*p.VAX_HOSP_MULT,
+                                                                   1-p.HOSP_COMORB_UNDER65*p.DRUG_RR_VAX_OR_LR*p.VAX_HOSP_MULT], cost=p.DRUG_COST, health_utility=0)
+    UNVAX_2 = ChanceNode(name='UNVAX_2', future_nodes=[T1, T2], probs=[p.HOSP_COMORB_UNDER65*p.DRUG_RR_UNVAX_HR,
+                                                                       1-p.HOSP_COMORB_UNDER65*p.DRUG_RR_UNVAX_HR], cost=p.DRUG_COST, health_utility=0)
+    AGE_UNDER_2 = ChanceNode(name='AGE_UNDER_2', future_nodes=[VAX_2, UNVAX_2], probs=[p.VAX_UNDER_65, 1-p.VAX_UNDER_65], cost=0, health_utility=0)
+    HR_2 = ChanceNode(name='HR_2', future_nodes=[AGE_OVER_2, AGE_UNDER_2], probs=[p.HR_65, 1-p.HR_65], cost=0, health_utility=0)
+
+    VAX_LR_2 = ChanceNode(name='VAX_LR_2', future_nodes=[T1, T2], probs=[p.HOSP_NOCOMORB_UNDER65 * p.VAX_HOSP_MULT,
+                                                                         1 - (p.HOSP_NOCOMORB_UNDER65 * p.VAX_HOSP_MULT)], cost=0, health_utility=0)
     UNVAX_LR_2 = ChanceNode(name='UNVAX_LR_2', future_nodes=[T1, T2],
-                            probs=[D.HOSP_NOCOMORB_UNDER65, 1 - D.HOSP_NOCOMORB_UNDER65], cost=0, health_utility=0)
-    LR_2 = ChanceNode(name='LR_2', future_nodes=[VAX_LR_2, UNVAX_LR_2], probs=[D.VAX_UNDER_65, 1-D.VAX_UNDER_65], cost=0, health_utility=0)
-    C2 = ChanceNode('C2', 0, [HR_2, LR_2], [D.HR, 1-D.HR], 0)  # all high risk
+                            probs=[p.HOSP_NOCOMORB_UNDER65, 1 - p.HOSP_NOCOMORB_UNDER65], cost=0, health_utility=0)
+    LR_2 = ChanceNode(name='LR_2', future_nodes=[VAX_LR_2, UNVAX_LR_2], probs=[p.VAX_UNDER_65, 1-p.VAX_UNDER_65], cost=0, health_utility=0)
+    C2 = ChanceNode('C2', 0, [HR_2, LR_2], [p.HR, 1-p.HR], 0)  # all high risk
 
     # ------------------- #
 
-    VAX_3_0 = ChanceNode('VAX_2_0', drug_cost, [T1, T2], [D.HOSP_COMORB_65 * D.VAX_HOSP_MULT * relative_risk_vax,
-                                                          1 - D.HOSP_COMORB_65 * D.VAX_HOSP_MULT * relative_risk_vax],
+    VAX_3_0 = ChanceNode('VAX_3_0', p.DRUG_COST, [T1, T2], [p.HOSP_COMORB_65 * p.VAX_HOSP_MULT * p.DRUG_RR_VAX_OR_LR,
+                                                          1 - p.HOSP_COMORB_65 * p.VAX_HOSP_MULT * p.DRUG_RR_VAX_OR_LR],
                          0)
-    UNVAX_3_0 = ChanceNode('UNVAX_2_0', drug_cost, [T1, T2],
-                           [D.HOSP_COMORB_65 * relative_risk_unvax, 1 - D.HOSP_COMORB_65 * relative_risk_unvax], 0)
-    VAX_3_1 = ChanceNode('VAX_3_1', drug_cost, [T1, T2], [D.HOSP_NOCOMORB_65 * D.VAX_HOSP_MULT * relative_risk_vax,
-                                                          1 - D.HOSP_NOCOMORB_65 * D.VAX_HOSP_MULT * relative_risk_vax],
+    UNVAX_3_0 = ChanceNode('UNVAX_3_0', p.DRUG_COST, [T1, T2],
+                           [p.HOSP_COMORB_65 * p.DRUG_RR_UNVAX_HR, 1 - p.HOSP_COMORB_65 * p.DRUG_RR_UNVAX_HR], 0)
+    VAX_3_1 = ChanceNode('VAX_3_1', p.DRUG_COST, [T1, T2], [p.HOSP_NOCOMORB_65 * p.VAX_HOSP_MULT * p.DRUG_RR_VAX_OR_LR,
+                                                          1 - p.HOSP_NOCOMORB_65 * p.VAX_HOSP_MULT * p.DRUG_RR_VAX_OR_LR],
                          0)
-    UNVAX_3_1 = ChanceNode('UNVAX_3_1', drug_cost, [T1, T2],
-                           [D.HOSP_NOCOMORB_65 * relative_risk_unvax, 1 - D.HOSP_NOCOMORB_65 * relative_risk_unvax], 0)
-    COMORB_3 = ChanceNode(name='COMORB_3', future_nodes=[VAX_3_0, UNVAX_3_0], probs=[D.VAX_OVER_65, 1 - D.VAX_OVER_65],
+    UNVAX_3_1 = ChanceNode('UNVAX_3_1', p.DRUG_COST, [T1, T2],
+                           [p.HOSP_NOCOMORB_65 * p.DRUG_RR_UNVAX_HR, 1 - p.HOSP_NOCOMORB_65 * p.DRUG_RR_UNVAX_HR], 0)
+    COMORB_3 = ChanceNode(name='COMORB_3', future_nodes=[VAX_3_0, UNVAX_3_0], probs=[p.VAX_OVER_65, 1 - p.VAX_OVER_65],
                           cost=0, health_utility=0)
     NO_COMORB_3 = ChanceNode(name='NO_COMORB_3', future_nodes=[VAX_3_1, UNVAX_3_1],
-                             probs=[D.VAX_OVER_65, 1 - D.VAX_OVER_65], cost=0, health_utility=0)
+                             probs=[p.VAX_OVER_65, 1 - p.VAX_OVER_65], cost=0, health_utility=0)
     AGE_OVER_3 = ChanceNode(name='AGE_OVER_3', future_nodes=[COMORB_3, NO_COMORB_3],
-                            probs=[D.HR_65_COMORB, 1 - D.HR_65_COMORB], cost=0, health_utility=0)
+                            probs=[p.HR_65_COMORB, 1 - p.HR_65_COMORB], cost=0, health_utility=0)
     VAX_3 = ChanceNode(name='VAX_3', future_nodes=[T1, T2],
-                       probs=[D.HOSP_COMORB_UNDER65 * relative_risk_vax * D.VAX_HOSP_MULT,
-                              1 - D.HOSP_COMORB_UNDER65 * relative_risk_vax * D.VAX_HOSP_MULT], cost=drug_cost,
+                       probs=[p.HOSP_COMORB_UNDER65 * p.DRUG_RR_VAX_OR_LR * p.VAX_HOSP_MULT,
+                              1 - p.HOSP_COMORB_UNDER65 * p.DRUG_RR_VAX_OR_LR * p.VAX_HOSP_MULT], cost=p.DRUG_COST,
                        health_utility=0)
-    UNVAX_3 = ChanceNode(name='UNVAX_3', future_nodes=[T1, T2], probs=[D.HOSP_COMORB_UNDER65 * relative_risk_unvax,
-                                                                       1 - D.HOSP_COMORB_UNDER65 * relative_risk_unvax],
-                         cost=drug_cost, health_utility=0)
+    UNVAX_3 = ChanceNode(name='UNVAX_3', future_nodes=[T1, T2], probs=[p.HOSP_COMORB_UNDER65 * p.DRUG_RR_UNVAX_HR,
+                                                                       1 - p.HOSP_COMORB_UNDER65 * p.DRUG_RR_UNVAX_HR],
+                         cost=p.DRUG_COST, health_utility=0)
     AGE_UNDER_3 = ChanceNode(name='AGE_UNDER_3', future_nodes=[VAX_3, UNVAX_3],
-                             probs=[D.VAX_UNDER_65, 1 - D.VAX_UNDER_65], cost=0, health_utility=0)
-    HR_3 = ChanceNode(name='HR_3', future_nodes=[AGE_OVER_3, AGE_UNDER_3], probs=[D.HR_65, 1-D.HR_65], cost=0, health_utility=0)
-    VAX_LR_3 = ChanceNode(name='VAX_LR_3', future_nodes=[T1, T2], probs=[D.HOSP_NOCOMORB_UNDER65 * D.VAX_HOSP_MULT,
-                                                                         1 - (D.HOSP_NOCOMORB_UNDER65 * D.VAX_HOSP_MULT)],cost=0, health_utility=0)
-    UNVAX_LR_3 = ChanceNode(name='UNVAX_LR_3', future_nodes=[T1, T2], probs=[D.HOSP_NOCOMORB_UNDER65*relative_risk_unvax,
-                                                                             1-D.HOSP_NOCOMORB_UNDER65*relative_risk_unvax], cost=drug_cost, health_utility=0)
-    LR_3 = ChanceNode(name='LR_3', future_nodes=[VAX_LR_3, UNVAX_LR_3], probs=[D.VAX_UNDER_65, 1-D.VAX_UNDER_65], cost=0, health_utility=0)
-    C3 = ChanceNode('C3', 0, [HR_3, LR_3], [D.HR, 1-D.HR], 0)  # high risk + low risk and un-vaccinated
+                             probs=[p.VAX_UNDER_65, 1 - p.VAX_UNDER_65], cost=0, health_utility=0)
+    HR_3 = ChanceNode(name='HR_3', future_nodes=[AGE_OVER_3, AGE_UNDER_3], probs=[p.HR_65, 1-p.HR_65], cost=0, health_utility=0)
+    VAX_LR_3 = ChanceNode(name='VAX_LR_3', future_nodes=[T1, T2], probs=[p.HOSP_NOCOMORB_UNDER65 * p.VAX_HOSP_MULT,
+                                                                         1 - (p.HOSP_NOCOMORB_UNDER65 * p.VAX_HOSP_MULT)],cost=0, health_utility=0)
+    UNVAX_LR_3 = ChanceNode(name='UNVAX_LR_3', future_nodes=[T1, T2], probs=[p.HOSP_NOCOMORB_UNDER65*p.DRUG_RR_UNVAX_HR,
+                                                                             1-p.HOSP_NOCOMORB_UNDER65*p.DRUG_RR_UNVAX_HR], cost=p.DRUG_COST, health_utility=0)
+    LR_3 = ChanceNode(name='LR_3', future_nodes=[VAX_LR_3, UNVAX_LR_3], probs=[p.VAX_UNDER_65, 1-p.VAX_UNDER_65], cost=0, health_utility=0)
+    C3 = ChanceNode('C3', 0, [HR_3, LR_3], [p.HR, 1-p.HR], 0)  # high risk + low risk and un-vaccinated
 
     # ---------------------------------- #
-    VAX_4_0 = ChanceNode('VAX_4_0', drug_cost, [T1, T2], [D.HOSP_COMORB_65 * D.VAX_HOSP_MULT * relative_risk_vax,
-                                                          1 - D.HOSP_COMORB_65 * D.VAX_HOSP_MULT * relative_risk_vax],
+    VAX_4_0 = ChanceNode('VAX_4_0', p.DRUG_COST, [T1, T2], [p.HOSP_COMORB_65 * p.VAX_HOSP_MULT * p.DRUG_RR_VAX_OR_LR,
+                                                          1 - p.HOSP_COMORB_65 * p.VAX_HOSP_MULT * p.DRUG_RR_VAX_OR_LR],
                          0)
-    UNVAX_4_0 = ChanceNode('UNVAX_4_0', drug_cost, [T1, T2],
-                           [D.HOSP_COMORB_65 * relative_risk_unvax, 1 - D.HOSP_COMORB_65 * relative_risk_unvax], 0)
-    VAX_4_1 = ChanceNode('VAX_4_1', drug_cost, [T1, T2], [D.HOSP_NOCOMORB_65 * D.VAX_HOSP_MULT * relative_risk_vax,
-                                                          1 - D.HOSP_NOCOMORB_65 * D.VAX_HOSP_MULT * relative_risk_vax], 0)
-    UNVAX_4_1 = ChanceNode('UNVAX_4_1', drug_cost, [T1, T2],
-                           [D.HOSP_NOCOMORB_65 * relative_risk_unvax, 1 - D.HOSP_NOCOMORB_65 * relative_risk_unvax], 0)
-    COMORB_4 = ChanceNode(name='COMORB_4', future_nodes=[VAX_4_0, UNVAX_4_0], probs=[D.VAX_OVER_65, 1 - D.VAX_OVER_65],
+    UNVAX_4_0 = ChanceNode('UNVAX_4_0', p.DRUG_COST, [T1, T2],
+                           [p.HOSP_COMORB_65 * p.DRUG_RR_UNVAX_HR, 1 - p.HOSP_COMORB_65 * p.DRUG_RR_UNVAX_HR], 0)
+    VAX_4_1 = ChanceNode('VAX_4_1', p.DRUG_COST, [T1, T2], [p.HOSP_NOCOMORB_65 * p.VAX_HOSP_MULT * p.DRUG_RR_VAX_OR_LR,
+                                                          1 - p.HOSP_NOCOMORB_65 * p.VAX_HOSP_MULT * p.DRUG_RR_VAX_OR_LR], 0)
+    UNVAX_4_1 = ChanceNode('UNVAX_4_1', p.DRUG_COST, [T1, T2],
+                           [p.HOSP_NOCOMORB_65 * p.DRUG_RR_UNVAX_HR, 1 - p.HOSP_NOCOMORB_65 * p.DRUG_RR_UNVAX_HR], 0)
+    COMORB_4 = ChanceNode(name='COMORB_4', future_nodes=[VAX_4_0, UNVAX_4_0], probs=[p.VAX_OVER_65, 1 - p.VAX_OVER_65],
                           cost=0, health_utility=0)
     NO_COMORB_4 = ChanceNode(name='NO_COMORB_4', future_nodes=[VAX_4_1, UNVAX_4_1],
-                             probs=[D.VAX_OVER_65, 1 - D.VAX_OVER_65], cost=0, health_utility=0)
+                             probs=[p.VAX_OVER_65, 1 - p.VAX_OVER_65], cost=0, health_utility=0)
     AGE_OVER_4 = ChanceNode(name='AGE_OVER_4', future_nodes=[COMORB_4, NO_COMORB_4],
-                            probs=[D.HR_65_COMORB, 1 - D.HR_65_COMORB], cost=0, health_utility=0)
+                            probs=[p.HR_65_COMORB, 1 - p.HR_65_COMORB], cost=0, health_utility=0)
     VAX_4 = ChanceNode(name='VAX_4', future_nodes=[T1, T2],
-                       probs=[D.HOSP_COMORB_UNDER65 * relative_risk_vax * D.VAX_HOSP_MULT,
-                              1 - D.HOSP_COMORB_UNDER65 * relative_risk_vax * D.VAX_HOSP_MULT], cost=drug_cost,
+                       probs=[p.HOSP_COMORB_UNDER65 * p.DRUG_RR_VAX_OR_LR * p.VAX_HOSP_MULT,
+                              1 - p.HOSP_COMORB_UNDER65 * p.DRUG_RR_VAX_OR_LR * p.VAX_HOSP_MULT], cost=p.DRUG_COST,
                        health_utility=0)
-    UNVAX_4 = ChanceNode(name='UNVAX_4', future_nodes=[T1, T2], probs=[D.HOSP_COMORB_UNDER65 * relative_risk_unvax,
-                                                                       1 - D.HOSP_COMORB_UNDER65 * relative_risk_unvax],
-                         cost=drug_cost, health_utility=0)
+    UNVAX_4 = ChanceNode(name='UNVAX_4', future_nodes=[T1, T2], probs=[p.HOSP_COMORB_UNDER65 * p.DRUG_RR_UNVAX_HR,
+                                                                       1 - p.HOSP_COMORB_UNDER65 * p.DRUG_RR_UNVAX_HR],
+                         cost=p.DRUG_COST, health_utility=0)
     AGE_UNDER_4 = ChanceNode(name='AGE_UNDER_4', future_nodes=[VAX_4, UNVAX_4],
-                             probs=[D.VAX_UNDER_65, 1 - D.VAX_UNDER_65], cost=0, health_utility=0)
-    HR_4 = ChanceNode(name='HR_4', future_nodes=[AGE_OVER_4, AGE_UNDER_4], probs=[D.HR_65, 1 - D.HR_65], cost=0,
+                             probs=[p.VAX_UNDER_65, 1 - p.VAX_UNDER_65], cost=0, health_utility=0)
+    HR_4 = ChanceNode(name='HR_4', future_nodes=[AGE_OVER_4, AGE_UNDER_4], probs=[p.HR_65, 1 - p.HR_65], cost=0,
                       health_utility=0)
-    VAX_LR_4 = ChanceNode(name='VAX_LR_4', future_nodes=[T1, T2], probs=[D.HOSP_NOCOMORB_UNDER65*relative_risk_vax*D.VAX_HOSP_MULT,
-                                                                         1-D.HOSP_NOCOMORB_UNDER65*relative_risk_vax*D.VAX_HOSP_MULT], cost=drug_cost, health_utility=0)
+    VAX_LR_4 = ChanceNode(name='VAX_LR_4', future_nodes=[T1, T2], probs=[p.HOSP_NOCOMORB_UNDER65*p.DRUG_RR_VAX_OR_LR*p.VAX_HOSP_MULT,
+                                                                         1-p.HOSP_NOCOMORB_UNDER65*p.DRUG_RR_VAX_OR_LR*p.VAX_HOSP_MULT], cost=p.DRUG_COST, health_utility=0)
     UNVAX_LR_4 = ChanceNode(name='UNVAX_LR_4', future_nodes=[T1, T2],
-                            probs=[D.HOSP_NOCOMORB_UNDER65 * relative_risk_unvax,
-                                   1 - D.HOSP_NOCOMORB_UNDER65 * relative_risk_unvax], cost=drug_cost, health_utility=0)
-    LR_4 = ChanceNode(name='LR_4', future_nodes=[VAX_LR_4, UNVAX_LR_4], probs=[D.VAX_UNDER_65, 1-D.VAX_UNDER_65], cost=0, health_utility=0)
-    C4 = ChanceNode(name='C4', cost=0, future_nodes=[HR_4, LR_4], probs=[D.HR, 1-D.HR], health_utility=0)  # all people
+                            probs=[p.HOSP_NOCOMORB_UNDER65 * p.DRUG_RR_UNVAX_HR,
+                                   1 - p.HOSP_NOCOMORB_UNDER65 * p.DRUG_RR_UNVAX_HR], cost=p.DRUG_COST, health_utility=0)
+    LR_4 = ChanceNode(name='LR_4', future_nodes=[VAX_LR_4, UNVAX_LR_4], probs=[p.VAX_UNDER_65, 1-p.VAX_UNDER_65], cost=0, health_utility=0)
+    C4 = ChanceNode(name='C4', cost=0, future_nodes=[HR_4, LR_4], probs=[p.HR, 1-p.HR], health_utility=0)  # all people
 
     # create Decision Nodes for each allocation strategy
     D0 = DecisionNode('D0', 0, [C0, C1, C2, C3, C4], 0)
 
-    exp_cost = D0.get_expected_cost()
-    exp_health_utility = D0.get_expected_health_utility()
+    return D0
+
+
+@lru_cache(maxsize=None)
+def get_compiled_template(build=build_decision_tree):
+    """
+    :param build: function that builds a tree from a namespace of parameters (see build_decision_tree)
+    :return: a CompiledTree of the tree built with the InputData values, whose structure is reused to compile the
+    trees built with other parameter values (compiled once, since the structure does not depend on the parameters)
+    """
+    return build(get_parameters()).compile()
+
+
+def simulate_decision_tree(drug_cost=D.DRUG_COST, hosp_cost=D.HOSP_COST, relative_risk_vax=D.DRUG_RR_VAX_OR_LR,
+                           relative_risk_unvax=D.DRUG_RR_UNVAX_HR, rr_pax_vax=D.PAXLOVID_RR_VAX_OR_LR, rr_pax_unvax=D.PAXLOVID_RR_UNVAX_HR):
+    D0 = build_decision_tree(get_parameters(DRUG_COST=drug_cost, HOSP_COST=hosp_cost, DRUG_RR_VAX_OR_LR=relative_risk_vax,
+                                            DRUG_RR_UNVAX_HR=relative_risk_unvax, PAXLOVID_RR_VAX_OR_LR=rr_pax_vax,
+                                            PAXLOVID_RR_UNVAX_HR=rr_pax_unvax))
+
+    exp_cost, exp_health_utility = D0.get_expected_values()
     incr_cost_eff_ratio = [exp_cost['C0'], exp_cost['C1'], exp_cost['C2'],
     exp_cost['C3'], exp_cost['C4'], exp_health_utility['C0'], exp_health_utility['C1'],
     exp_health_utility['C2'], exp_health_utility['C3'], exp_health_utility['C4']]
 
     return incr_cost_eff_ratio
 
+
+def simulate_decision_tree_batch(drug_cost=D.DRUG_COST, hosp_cost=D.HOSP_COST, relative_risk_vax=D.DRUG_RR_VAX_OR_LR,
+                                 relative_risk_unvax=D.DRUG_RR_UNVAX_HR, rr_pax_vax=D.PAXLOVID_RR_VAX_OR_LR,
+                                 rr_pax_unvax=D.PAXLOVID_RR_UNVAX_HR, chunk_size=2**15, **params):
+    """ evaluates the decision tree for a whole batch of parameter draws at once
+    (arguments are floats or numpy arrays of draws; scalars are used for every draw)
+    :param chunk_size: number of draws evaluated per pass over the tree
+        (every node holds one array of this length, so this bounds the memory use)
+    :param params: values of other InputData parameters with parameter names as keywords (e.g. VAX_HOSP_MULT=0.3);
+        the parameters that have arguments above cannot be passed by their InputData names
+    :return: (numpy.array) of shape (number of draws, 10) where each row is the output of
+    simulate_decision_tree for the corresponding draw (expected costs of C0-C4, then expected health utilities of C0-C4)
+    """
+
+    arguments = dict(drug_cost=drug_cost, hosp_cost=hosp_cost, relative_risk_vax=relative_risk_vax,
+                     relative_risk_unvax=relative_risk_unvax, rr_pax_vax=rr_pax_vax, rr_pax_unvax=rr_pax_unvax)
+    # these parameters have named arguments, so passing them by their InputData names would be ambiguous
+    for name, argument in ARGUMENT_NAMES.items():
+        if name in params:
+            raise ValueError('Pass {} as {}.'.format(name, argument))
+        params[name] = arguments[argument]
+
+    # broadcast all parameters to the same length so that every node holds one value per draw
+    names = list(params)
+    values = np.broadcast_arrays(*[np.atleast_1d(np.asarray(params[name], dtype=float)) for name in names])
+
+    n_draws = len(values[0])
+    result = np.empty((n_draws, 10))
+
+    for start in range(0, n_draws, chunk_size):
+        end = min(start + chunk_size, n_draws)
+
+        # build the tree once for this chunk; its compiled form (with the structure compiled once, see
+        # get_compiled_template) evaluates all draws of the chunk in one sweep
+        tree = build_decision_tree(get_parameters(
+            **{name: value[start:end] for name, value in zip(names, values)})).compile(get_compiled_template())
+        exp_cost = tree.get_expected_cost()
+        exp_health_utility = tree.get_expected_health_utility()
+
+        for i, name in enumerate(STRATEGIES):
+            result[start:end, i] = exp_cost[name]
+            result[start:end, len(STRATEGIES) + i] = exp_health_utility[name]
+
+    return result
+
+
+def get_cost_coefficients(cost_names=('DRUG_COST', 'PAXLOVID_COST', 'HOSP_COST'), chunk_size=2**15, **params):
+    """ expected costs of the strategies as affine functions of cost parameters
+    (cost parameters only enter the tree as costs of visiting nodes, so the expected cost of each strategy is
+    intercept + sum_j coefficient_j * (cost parameter j); the intercept and the coefficients (partial derivatives)
+    are found in one pass over the tree by evaluating the cost parameters at 0 and at unit values as extra draws)
+    :param cost_names: names of the cost parameters
+    :param chunk_size: number of draws evaluated per pass over the tree
+    :param params: values of the other InputData parameters (floats or numpy arrays of draws) with parameter names
+        as keywords (the values of the cost parameters only set the number of draws)
+    :return: (intercepts as a numpy.array of shape (number of draws, 5),
+              coefficients as a numpy.array of shape (number of draws, 5, number of cost parameters),
+              expected health utilities as a numpy.array of shape (number of draws, 5)) of strategies C0-C4
+    """
+
+    # the number of draws is that of all parameters, including the cost parameters
+    # (e.g. only HOSP_COST may have draws, while the other parameters keep their InputData values)
+    values = np.broadcast_arrays(np.zeros(1), *[np.atleast_1d(np.asarray(value, dtype=float))
+                                                for value in params.values()])
+    n_draws = len(values[0])
+    names = [name for name in params if name not in cost_names]
+    values = [value for name, value in zip(params, values[1:]) if name not in cost_names]
+    n_costs = len(cost_names)
+
+    # cost parameters of the extra draws: all zero, then each one at 1
+    basis = np.vstack([np.zeros(n_costs), np.eye(n_costs)])
+
+    intercepts = np.empty((n_draws, 5))
+    coefficients = np.empty((n_draws, 5, n_costs))
+    health_utilities = np.empty((n_draws, 5))
+
+    # the extra draws multiply the length of the arrays of the tree by (1 + number of cost parameters)
+    step = max(1, chunk_size // (n_costs + 1))
+    for start in range(0, n_draws, step):
+        end = min(start + step, n_draws)
+        n = end - start
+
+        chunk_params = {name: np.tile(value[start:end], n_costs + 1) for name, value in zip(names, values)}
+        for j, name in enumerate(cost_names):
+            chunk_params[name] = np.repeat(basis[:, j], n)
+
+        tree = build_decision_tree(get_parameters(**chunk_params)).compile(get_compiled_template())
+        exp_cost = tree.get_expected_cost()
+        exp_health_utility = tree.get_expected_health_utility()
+
+        for i, name in enumerate(STRATEGIES):
+            blocks = np.broadcast_to(exp_cost[name], ((n_costs + 1) * n,)).reshape(n_costs + 1, n)
+            intercepts[start:end, i] = blocks[0]
+            coefficients[start:end, i] = (blocks[1:] - blocks[0]).T
+            health_utilities[start:end, i] = np.broadcast_to(exp_health_utility[name], ((n_costs + 1) * n,))[:n]
+
+    return intercepts, coefficients, health_utilities
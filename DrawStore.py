@@ -0,0 +1,118 @@
+import json
+import os
+
+import numpy as np
+
+HEADER_FILE = 'header.json'
+OUTPUT_COLUMNS = ['cost_C0', 'cost_C1', 'cost_C2', 'cost_C3', 'cost_C4',
+                  'effect_C0', 'effect_C1', 'effect_C2', 'effect_C3', 'effect_C4']
+
+
+class DrawStore:
+    """ on-disk, columnar store of PSA draws
+    a directory with one .npy file per parameter plus one .npy file of the 10 outputs of the decision tree,
+    and a small JSON header that records the run settings and which chunks are complete.
+    the .npy files are allocated at their full size when the store is created and are filled chunk by chunk,
+    so a run that is stopped can resume from its last complete chunk; arrays are read back as numpy memmaps. """
+
+    def __init__(self, directory):
+        """ opens an existing store
+        :param directory: directory of the store
+        """
+
+        self.directory = directory
+        with open(os.path.join(directory, HEADER_FILE)) as file:
+            self.header = json.load(file)
+
+    @staticmethod
+    def create(directory, param_names, n_draws, chunk_size, settings=None):
+        """ creates a new store (or opens the store in this directory if it was created with the same settings)
+        :param directory: directory of the store
+        :param param_names: (list) names of the sampled parameters
+        :param n_draws: number of draws
+        :param chunk_size: number of draws per chunk
+        :param settings: (dictionary) other settings of the run to record in the header (e.g. the seed)
+        :return: the DrawStore
+        """
+
+        header = {'param_names': list(param_names),
+                  'output_columns': OUTPUT_COLUMNS,
+                  'n_draws': n_draws,
+                  'chunk_size': chunk_size,
+                  'settings': settings or {},
+                  'completed_chunks': []}
+
+        if os.path.exists(os.path.join(directory, HEADER_FILE)):
+            store = DrawStore(directory)
+            for key in ('param_names', 'output_columns', 'n_draws', 'chunk_size', 'settings'):
+                if store.header[key] != header[key]:
+                    raise ValueError('The store in {} was created with a different {}.'.format(directory, key))
+            return store
+
+        os.makedirs(directory, exist_ok=True)
+        for name in param_names:
+            np.lib.format.open_memmap(os.path.join(directory, name + '.npy'), mode='w+', shape=(n_draws,))
+        np.lib.format.open_memmap(os.path.join(directory, 'outputs.npy'), mode='w+',
+                                  shape=(n_draws, len(OUTPUT_COLUMNS)))
+
+        store = DrawStore.__new__(DrawStore)
+        store.directory = directory
+        store.header = header
+        store._write_header()
+        return store
+
+    def _write_header(self):
+        """ writes the header atomically (a run killed while writing leaves the previous header) """
+
+        path = os.path.join(self.directory, HEADER_FILE)
+        with open(path + '.tmp', 'w') as file:
+            json.dump(self.header, file, indent=2)
+        os.replace(path + '.tmp', path)
+
+    def get_n_chunks(self):
+        """ :return: number of chunks """
+        return -(-self.header['n_draws'] // self.header['chunk_size'])
+
+    def get_missing_chunks(self):
+        """ :return: (list) indices of the chunks that are not yet complete """
+        completed = set(self.header['completed_chunks'])
+        return [i for i in range(self.get_n_chunks()) if i not in completed]
+
+    def is_complete(self):
+        """ :return: True if all chunks are written """
+        return len(self.get_missing_chunks()) == 0
+
+    def write_chunk(self, i, params, outputs):
+        """ writes the draws of one chunk and marks it as complete
+        :param i: index of the chunk
+        :param params: dictionary of parameter draws of this chunk with parameter names as dictionary keys
+        :param outputs: (numpy.array) of shape (number of draws in the chunk, 10)
+        """
+
+        start = i * self.header['chunk_size']
+        end = start + len(outputs)
+
+        for name in self.header['param_names']:
+            array = np.load(os.path.join(self.directory, name + '.npy'), mmap_mode='r+')
+            array[start:end] = params[name]
+            array.flush()
+        array = np.load(os.path.join(self.directory, 'outputs.npy'), mmap_mode='r+')
+        array[start:end] = outputs
+        array.flush()
+
+        # the chunk is only recorded as complete after its data are on disk
+        self.header['completed_chunks'] = sorted(set(self.header['completed_chunks']) | {i})
+        self._write_header()
+
+    def get_param(self, name):
+        """ :return: (numpy.memmap) read-only draws of a parameter """
+        return np.load(os.path.join(self.directory, name + '.npy'), mmap_mode='r')
+
+    def get_params(self):
+        """ :return: dictionary of read-only parameter draws (numpy.memmap) with parameter names as keys """
+        return {name: self.get_param(name) for name in self.header['param_names']}
+
+    def get_outputs(self):
+        """ :return: (numpy.memmap) read-only array of shape (n_draws, 10) with the expected costs of
+        strategies C0-C4 followed by their expected health utilities """
+        return np.load(os.path.join(self.directory, 'outputs.npy'), mmap_mode='r')
@@ -0,0 +1,133 @@
+import math
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import Accumulators
+import DecisionTree2 as Tree
+from DecisionTree2 import STRATEGIES
+
+CHUNK_SIZE = 2**16  # number of patients simulated at once
+
+
+def get_depth(node):
+    """ :return: number of chance nodes on the longest path from this node to a terminal node """
+    if isinstance(node, Tree.TerminalNode):
+        return 0
+    return 1 + max(get_depth(future_node) for future_node in node.futureNodes)
+
+
+def walk(node, patients, u, level, costs, outcomes):
+    """ moves patients down the tree from this node, adding the costs and health utilities of the visited nodes
+    :param node: the node the patients are at
+    :param patients: (numpy.array) indices of the patients at this node
+    :param u: (numpy.array) of shape (tree depth, number of patients) of uniform random numbers; row 'level'
+        chooses the branch of each patient at this level of the tree
+    :param level: level of this node below the strategy node
+    :param costs: (numpy.array) cost of each patient (updated)
+    :param outcomes: (numpy.array) health utility of each patient, i.e. 1 if hospitalized (updated)
+    """
+
+    costs[patients] += node.cost
+    outcomes[patients] += node.healthUtility
+    if isinstance(node, Tree.TerminalNode):
+        return
+
+    # branch of each patient from the cumulative probabilities of the future nodes
+    branches = np.searchsorted(np.cumsum(node.probs), u[level, patients], side='right')
+    branches = np.minimum(branches, len(node.futureNodes) - 1)
+    for i, future_node in enumerate(node.futureNodes):
+        walk(future_node, patients[branches == i], u, level + 1, costs, outcomes)
+
+
+def simulate_chunk(seed_sequence, n_patients, params):
+    """ simulates the patients of one chunk under every strategy with common random numbers
+    (the subtrees of all strategies branch on the same patient attributes in the same order, so the same uniform
+    random numbers give each patient the same attributes and a coupled hospitalization outcome in every strategy)
+    :param seed_sequence: numpy.random.SeedSequence of this chunk
+    :param n_patients: number of patients in this chunk
+    :param params: dictionary of values of InputData parameters (floats) with parameter names as dictionary keys
+    :return: (numbers of hospitalizations as a numpy.array of integers of shape (5,),
+              list of collections.Counter of the numbers of patients with each cost) of strategies C0-C4
+        (a patient's cost is the sum of the costs of the nodes on its path, so a chunk has only a few distinct
+        costs, and integer counts of them can be merged exactly)
+    """
+
+    decision_node = Tree.build_decision_tree(Tree.get_parameters(**params))
+    strategies = {node.name: node for node in decision_node.futureNode}
+
+    rng = np.random.default_rng(seed_sequence)
+    u = rng.random((max(get_depth(node) for node in strategies.values()), n_patients))
+
+    hospitalizations = np.zeros(len(STRATEGIES), dtype=np.int64)
+    cost_counts = []
+    patients = np.arange(n_patients)
+    for i, name in enumerate(STRATEGIES):
+        costs = np.full(n_patients, float(decision_node.cost))
+        outcomes = np.full(n_patients, float(decision_node.healthUtility))
+        walk(strategies[name], patients, u, 0, costs, outcomes)
+        hospitalizations[i] = np.count_nonzero(outcomes)
+        values, counts = np.unique(costs, return_counts=True)
+        cost_counts.append(Counter(dict(zip(values.tolist(), counts.tolist()))))
+
+    return hospitalizations, cost_counts
+
+
+def run_microsimulation(cohort_size=5000000, n_replications=1, seed=0, n_workers=1, chunk_size=CHUNK_SIZE,
+                        params=None):
+    """ individual-level simulation of a cohort of patients under every strategy
+    (patients are simulated in chunks whose outcomes are summarized by integer counts that are merged exactly, so
+    the memory use does not grow with the cohort size; chunk j of replication r always gets the same random numbers)
+    :param cohort_size: number of patients in the cohort
+    :param n_replications: number of simulated cohorts
+    :param seed: seed of the root numpy.random.SeedSequence
+    :param n_workers: number of worker processes (the result does not depend on this)
+    :param chunk_size: number of patients per chunk
+    :param params: dictionary of values of InputData parameters with parameter names as dictionary keys; values
+        are floats, or arrays with one value per replication (e.g. PSA draws) to include parameter uncertainty
+    :return: dictionary with keys 'hospitalizations' and 'costs' (numpy arrays of shape (n_replications, 5) of the
+        number of hospitalizations and the total cost of each cohort under strategies C0-C4) and 'summary'
+        (Accumulators.PSAAccumulator of the numbers of hospitalizations and total costs of the cohorts, i.e. of their
+        spread across replications)
+    """
+
+    if cohort_size < 1 or n_replications < 1:
+        raise ValueError('The cohort size and the number of replications should be at least 1.')
+
+    params = params or {}
+    replication_params = [{name: float(np.broadcast_to(value, (n_replications,))[r]) for name, value in params.items()}
+                          for r in range(n_replications)]
+
+    # one task per chunk of each replication
+    n_chunks = math.ceil(cohort_size / chunk_size)
+    tasks = []
+    for r, replication_seed in enumerate(np.random.SeedSequence(seed).spawn(n_replications)):
+        for j, chunk_seed in enumerate(replication_seed.spawn(n_chunks)):
+            tasks.append((chunk_seed, min(chunk_size, cohort_size - j * chunk_size), replication_params[r]))
+
+    hospitalizations = np.zeros((n_replications, len(STRATEGIES)), dtype=np.int64)
+    cost_counts = [[Counter() for _ in STRATEGIES] for _ in range(n_replications)]
+
+    def merge(results):
+        for i, (chunk_hospitalizations, chunk_cost_counts) in enumerate(results):
+            hospitalizations[i // n_chunks] += chunk_hospitalizations
+            for counts, chunk_counts in zip(cost_counts[i // n_chunks], chunk_cost_counts):
+                counts.update(chunk_counts)
+
+    if n_workers == 1:
+        merge(map(simulate_chunk, *zip(*tasks)))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            merge(executor.map(simulate_chunk, *zip(*tasks), chunksize=max(1, len(tasks) // (4 * n_workers))))
+
+    # total cost of each cohort from the numbers of patients with each cost (math.fsum does not depend on the order
+    # of the terms, so neither does the result depend on the chunks or the number of workers)
+    costs = np.array([[math.fsum(cost * count for cost, count in counts.items()) for counts in cohort]
+                      for cohort in cost_counts])
+
+    summary = Accumulators.PSAAccumulator()
+    summary.add(np.concatenate([costs, hospitalizations], axis=1))
+
+    return {'hospitalizations': hospitalizations,
+            'costs': costs,
+            'summary': summary}
@@ -0,0 +1,271 @@
+import math
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+import Accumulators
+import DecisionTree2
+import DrawStore
+import ParameterRegistry
+
+REGISTRY = ParameterRegistry.get_default_registry()  # point values and distributions of the parameters
+
+CHUNK_SIZE = 2**16  # number of draws per chunk (chunks, not workers, determine the random number streams)
+PROBABILITY_Z = 1.96  # z-value of the Agresti-Coull adjustment of the standard errors of probabilities (see get_mcse)
+
+
+def sample_parameters(rng, n_draws, method='mc'):
+    """
+    :param rng: numpy.random.Generator
+    :param n_draws: number of draws
+    :param method: 'mc', 'lhs' or 'sobol' (see ParameterRegistry.ParameterRegistry.sample)
+    :return: dictionary of parameter draws (numpy arrays) with InputData parameter names as dictionary keys
+    """
+    return REGISTRY.sample(n_draws, method=method, rng=rng)
+
+
+def evaluate_draws(params):
+    """
+    :param params: dictionary of parameter draws with InputData parameter names as dictionary keys
+    :return: numpy.array of shape (number of draws, 10) of simulate_decision_tree outputs
+    """
+    return DecisionTree2.simulate_decision_tree_batch(
+        **{DecisionTree2.ARGUMENT_NAMES.get(name, name): value for name, value in params.items()})
+
+
+def run_chunk(seed_sequence, n_draws, method='mc'):
+    """ samples and evaluates one chunk of PSA draws
+    :param seed_sequence: numpy.random.SeedSequence of this chunk
+    :param n_draws: number of draws in this chunk
+    :param method: 'mc', 'lhs' or 'sobol' (the Latin hypercube or Sobol points are randomized per chunk)
+    :return: (dictionary of parameter draws, numpy.array of shape (n_draws, 10) of simulate_decision_tree outputs)
+    """
+
+    rng = np.random.default_rng(seed_sequence)
+    params = sample_parameters(rng, n_draws, method)
+
+    return params, evaluate_draws(params)
+
+
+def get_chunks(n_draws, seed, chunk_size=CHUNK_SIZE):
+    """
+    :return: (list) of (seed sequence, number of draws) of each chunk; chunk i always gets the i-th child of
+    the root seed sequence, so the draws of a PSA only depend on the seed and the chunk size
+    """
+
+    n_chunks = math.ceil(n_draws / chunk_size)
+    seed_sequences = np.random.SeedSequence(seed).spawn(n_chunks)
+
+    return [(seed_sequences[i], min(chunk_size, n_draws - i * chunk_size)) for i in range(n_chunks)]
+
+
+def run_psa(n_draws=10000, seed=0, n_workers=1, chunk_size=CHUNK_SIZE, method='mc'):
+    """ probabilistic sensitivity analysis of the decision tree
+    :param n_draws: number of PSA draws
+    :param seed: seed of the root numpy.random.SeedSequence
+    :param n_workers: number of worker processes (the result does not depend on this)
+    :param chunk_size: number of draws per chunk
+    :param method: 'mc' for Monte Carlo, 'lhs' for Latin hypercube or 'sobol' for scrambled Sobol sampling
+    :return: (dictionary of parameter draws, numpy.array of shape (n_draws, 10) with the expected costs of
+    strategies C0-C4 followed by their expected health utilities for each draw)
+    """
+
+    if n_draws < 1:
+        raise ValueError('The number of PSA draws should be at least 1.')
+
+    chunks = get_chunks(n_draws, seed, chunk_size)
+
+    if n_workers == 1:
+        results = [run_chunk(*chunk, method) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            # map returns the results in the order of the chunks
+            results = list(executor.map(run_chunk, *zip(*chunks), repeat(method)))
+
+    params = {name: np.concatenate([result[0][name] for result in results]) for name in results[0][0]}
+    outputs = np.concatenate([result[1] for result in results])
+
+    return params, outputs
+
+
+def run_chunk_summary(seed_sequence, n_draws, method='mc'):
+    """ samples and evaluates one chunk of PSA draws
+    :return: Accumulators.PSAAccumulator of the outputs of this chunk (the draws are not returned)
+    """
+
+    accumulator = Accumulators.PSAAccumulator()
+    accumulator.add(run_chunk(seed_sequence, n_draws, method)[1])
+    return accumulator
+
+
+def run_psa_summary(n_draws=10000, seed=0, n_workers=1, chunk_size=CHUNK_SIZE, method='mc'):
+    """ probabilistic sensitivity analysis that streams the outputs of each chunk into accumulators, so the
+    memory use does not grow with the number of draws (same draws as run_psa for the same seed and chunk size)
+    :param n_draws: number of PSA draws
+    :param seed: seed of the root numpy.random.SeedSequence
+    :param n_workers: number of worker processes (the result does not depend on this)
+    :param chunk_size: number of draws per chunk
+    :param method: 'mc' for Monte Carlo, 'lhs' for Latin hypercube or 'sobol' for scrambled Sobol sampling
+    :return: Accumulators.PSAAccumulator of all draws
+    """
+
+    if n_draws < 1:
+        raise ValueError('The number of PSA draws should be at least 1.')
+
+    chunks = get_chunks(n_draws, seed, chunk_size)
+    accumulator = Accumulators.PSAAccumulator()
+
+    if n_workers == 1:
+        for chunk in chunks:
+            accumulator.merge(run_chunk_summary(*chunk, method))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            # accumulators are merged in the order of the chunks, so the result does not depend on the workers
+            for chunk_accumulator in executor.map(run_chunk_summary, *zip(*chunks), repeat(method)):
+                accumulator.merge(chunk_accumulator)
+
+    return accumulator
+
+
+def run_psa_to_store(directory, n_draws=10000, seed=0, n_workers=1, chunk_size=CHUNK_SIZE, method='mc'):
+    """ probabilistic sensitivity analysis that writes the draws chunk by chunk to an on-disk DrawStore;
+    if the directory holds a store of an interrupted run with the same settings, only the missing chunks are run
+    (same draws as run_psa for the same seed and chunk size)
+    :param directory: directory of the store
+    :param n_draws: number of PSA draws
+    :param seed: seed of the root numpy.random.SeedSequence
+    :param n_workers: number of worker processes (the result does not depend on this)
+    :param chunk_size: number of draws per chunk
+    :param method: 'mc' for Monte Carlo, 'lhs' for Latin hypercube or 'sobol' for scrambled Sobol sampling
+    :return: the DrawStore (use get_params and get_outputs to read the draws as memmaps)
+    """
+
+    if n_draws < 1:
+        raise ValueError('The number of PSA draws should be at least 1.')
+
+    store = DrawStore.DrawStore.create(directory, param_names=REGISTRY.get_uncertain_names(), n_draws=n_draws,
+                                       chunk_size=chunk_size, settings={'seed': seed, 'method': method})
+
+    chunks = get_chunks(n_draws, seed, chunk_size)
+    missing = store.get_missing_chunks()
+
+    if n_workers == 1:
+        for i in missing:
+            store.write_chunk(i, *run_chunk(*chunks[i], method))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = executor.map(run_chunk, *zip(*[chunks[i] for i in missing]), repeat(method))
+            for i, (params, outputs) in zip(missing, results):
+                store.write_chunk(i, params, outputs)
+
+    return store
+
+
+def run_adaptive_batch(seed_sequence, n_draws, method, wtps):
+    """ samples and evaluates one batch of an adaptive PSA
+    :return: (Accumulators.PSAAccumulator, Accumulators.AcceptabilityCounter) of the outputs of this batch
+    """
+
+    outputs = run_chunk(seed_sequence, n_draws, method)[1]
+    accumulator = Accumulators.PSAAccumulator()
+    accumulator.add(outputs)
+    counter = Accumulators.AcceptabilityCounter(wtps)
+    counter.add(outputs)
+    return accumulator, counter
+
+
+def get_mcse(accumulator, counter):
+    """
+    :return: dictionary of Monte Carlo standard errors with keys 'cost' and 'effect' (arrays of the means of each
+    strategy), 'icer' (array of the standard errors of the ICERs with respect to the base strategy, relative to
+    the absolute values of the ICERs) and 'probability' (array of shape (strategies, wtp values) of the standard
+    errors of the probabilities of being cost-effective)
+    """
+
+    n = accumulator.get_n()
+    n_strategies = accumulator.nStrategies
+    standard_errors = np.sqrt(accumulator.moments.get_variance() / n)
+
+    icer_errors = []
+    for i in range(1, n_strategies):
+        icer, standard_error = accumulator.get_icer_standard_error(i)
+        icer_errors.append(standard_error / abs(icer))
+
+    # the binomial standard error p(1-p)/n is 0 for a probability estimated as 0 or 1, however few the draws, so
+    # the probabilities are adjusted as in the Agresti-Coull interval (z^2/2 successes and failures are added)
+    z2 = PROBABILITY_Z ** 2
+    probabilities = (counter.get_probabilities() * n + z2 / 2) / (n + z2)
+
+    return {'cost': standard_errors[:n_strategies],
+            'effect': standard_errors[n_strategies:2 * n_strategies],
+            'icer': np.array(icer_errors),
+            'probability': np.sqrt(probabilities * (1 - probabilities) / (n + z2))}
+
+
+def run_adaptive_psa(cost_tolerance=None, effect_tolerance=None, icer_tolerance=0.01, probability_tolerance=0.005,
+                     wtps=(50000, 100000, 500000), batch_size=CHUNK_SIZE, max_draws=10**7, seed=0, n_workers=1,
+                     method='mc'):
+    """ probabilistic sensitivity analysis that runs batches of draws until the Monte Carlo standard errors
+    of the estimates are within the tolerances (tolerances that are None are not checked)
+    (batch i gets the same draws as chunk i of run_psa with a chunk size equal to the batch size, and the
+    number of batches run does not depend on the number of workers; with 'lhs' or 'sobol' sampling the
+    standard errors are those of independent draws, so they overstate the error and the run stops later)
+    :param cost_tolerance: tolerance for the standard errors of the mean costs of the strategies
+    :param effect_tolerance: tolerance for the standard errors of the mean effects of the strategies
+    :param icer_tolerance: tolerance for the standard errors of the ICERs with respect to the base strategy,
+        relative to the absolute values of the ICERs
+    :param probability_tolerance: tolerance for the standard errors of the probabilities of being cost-effective
+    :param wtps: willingness-to-pay values of the probabilities of being cost-effective
+    :param batch_size: number of draws per batch
+    :param max_draws: the run stops after this many draws even if the tolerances are not met
+    :param seed: seed of the root numpy.random.SeedSequence
+    :param n_workers: number of worker processes (each runs one batch at a time)
+    :param method: 'mc' for Monte Carlo, 'lhs' for Latin hypercube or 'sobol' for scrambled Sobol sampling
+    :return: dictionary with keys 'accumulator' (Accumulators.PSAAccumulator of all draws), 'counter'
+        (Accumulators.AcceptabilityCounter), 'converged' (True if the tolerances were met), 'n_draws' and 'trace'
+        (list with one dictionary per batch with keys 'n_draws' and 'mcse' as returned by get_mcse)
+    """
+
+    tolerances = {'cost': cost_tolerance, 'effect': effect_tolerance,
+                  'icer': icer_tolerance, 'probability': probability_tolerance}
+
+    root = np.random.SeedSequence(seed)
+    accumulator = Accumulators.PSAAccumulator()
+    counter = Accumulators.AcceptabilityCounter(wtps)
+    trace = []
+    converged = False
+
+    executor = ProcessPoolExecutor(max_workers=n_workers) if n_workers > 1 else None
+    try:
+        while not converged and accumulator.get_n() < max_draws:
+            # batches of this round (later children of the root seed sequence are spawned in the next rounds)
+            sizes = []
+            n = accumulator.get_n()
+            while len(sizes) < n_workers and n < max_draws:
+                sizes.append(min(batch_size, max_draws - n))
+                n += sizes[-1]
+            seed_sequences = root.spawn(len(sizes))
+
+            args = (seed_sequences, sizes, repeat(method), repeat(wtps))
+            results = executor.map(run_adaptive_batch, *args) if executor else map(run_adaptive_batch, *args)
+
+            # batches are added in order and the run stops after the first batch that meets the tolerances
+            for batch_accumulator, batch_counter in results:
+                accumulator.merge(batch_accumulator)
+                counter.merge(batch_counter)
+
+                mcse = get_mcse(accumulator, counter)
+                trace.append({'n_draws': accumulator.get_n(), 'mcse': mcse})
+                converged = all(np.all(mcse[key] <= tolerance)
+                                for key, tolerance in tolerances.items() if tolerance is not None)
+                if converged:
+                    break
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+
+    return {'accumulator': accumulator,
+            'counter': counter,
+            'converged': converged,
+            'n_draws': accumulator.get_n(),
+            'trace': trace}
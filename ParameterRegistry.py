@@ -0,0 +1,173 @@
+import math
+import warnings
+
+import numpy as np
+from scipy import stats
+from scipy.stats import qmc
+import InputData as D
+
+SAMPLING_METHODS = ('mc', 'lhs', 'sobol')
+
+# PSA DISTRIBUTIONS #
+SE_DRUG_VAX_RR = (np.log(0.76) - np.log(0.30)) / 2 * 1.96
+SE_DRUG_UNVAX_RR = (np.log(0.83) - np.log(0.01)) / 2 * 1.96
+SE_PAX_VAX_RR = (np.log(0.81) - np.log(0.44)) / 2 * 1.96
+SE_PAX_UNVAX_RR = (np.log(0.49) - np.log(0.15)) / 2 * 1.96
+HOSP_COST_SHAPE = math.pow(24826, 2) / math.pow((25858 - 23795 / 2 * 1.96), 2)  # gamma distribution of hospital cost
+HOSP_COST_SCALE = math.pow((25858 - 23795 / 2 * 1.96), 2) / 24826
+
+
+class Fixed:
+    """ a parameter that is not varied """
+
+    def __init__(self, value):
+        self.value = value
+
+    def sample(self, rng, n):
+        return np.full(n, float(self.value))
+
+    def ppf(self, u):
+        return np.full(len(u), float(self.value))
+
+
+class ExpUniform:
+    """ exponential of a uniform random variable (the parameter is log-uniform on [exp(low), exp(high)]) """
+
+    def __init__(self, low, high):
+        """
+        :param low: lower bound of the uniform variable
+        :param high: upper bound of the uniform variable
+        """
+        self.low = low
+        self.high = high
+
+    def sample(self, rng, n):
+        return np.exp(rng.uniform(self.low, self.high, n))
+
+    def ppf(self, u):
+        return np.exp(self.low + (self.high - self.low) * u)
+
+
+class LogNormal:
+    """ exponential of a normal random variable """
+
+    def __init__(self, mean_log, sd_log):
+        """
+        :param mean_log: mean of the logarithm of the parameter
+        :param sd_log: standard deviation of the logarithm of the parameter
+        """
+        self.meanLog = mean_log
+        self.sdLog = sd_log
+
+    def sample(self, rng, n):
+        return np.exp(rng.normal(self.meanLog, self.sdLog, n))
+
+    def ppf(self, u):
+        return np.exp(stats.norm.ppf(u, self.meanLog, self.sdLog))
+
+
+class Gamma:
+    """ gamma distribution with shape and scale parameters """
+
+    def __init__(self, shape, scale):
+        self.shape = shape
+        self.scale = scale
+
+    def sample(self, rng, n):
+        return rng.gamma(self.shape, self.scale, n)
+
+    def ppf(self, u):
+        return stats.gamma.ppf(u, self.shape, scale=self.scale)
+
+
+class ParameterRegistry:
+    """ point value and distribution of every model parameter
+    (parameters without a distribution keep their point value; the varied parameters are sampled in the order
+    their distributions were set, which fixes the random numbers each parameter gets) """
+
+    def __init__(self):
+        self.pointValues = {}
+        self.distributions = {}
+
+    def add(self, name, point_value, distribution=None):
+        """
+        :param name: name of the parameter (as in InputData)
+        :param point_value: value of the parameter in the base case
+        :param distribution: distribution of the parameter in the PSA (the point value is used if None)
+        """
+        self.pointValues[name] = point_value
+        self.distributions[name] = Fixed(point_value)
+        if distribution is not None:
+            self.set_distribution(name, distribution)
+
+    def set_distribution(self, name, distribution):
+        """ changes the distribution of a parameter (e.g. to vary DRUG_COST in a scenario) """
+        if name not in self.pointValues:
+            raise ValueError('{} is not a registered parameter.'.format(name))
+        # (re-inserted so that the order of the dictionary is the order of sampling)
+        del self.distributions[name]
+        self.distributions[name] = distribution
+
+    def get_uncertain_names(self):
+        """ :return: (list) names of the parameters that are varied in the PSA """
+        return [name for name, dist in self.distributions.items() if not isinstance(dist, Fixed)]
+
+    def sample(self, n, method='mc', rng=None, uncertain_only=True):
+        """ samples all parameters in one call
+        :param n: number of draws
+        :param method: 'mc' for Monte Carlo, 'lhs' for Latin hypercube sampling or 'sobol' for scrambled Sobol points
+            (the quasi-random points are mapped to the parameters by the inverse of their distribution functions)
+        :param rng: numpy.random.Generator (also used to randomize the Latin hypercube and Sobol points)
+        :param uncertain_only: set to False to also return the parameters that are not varied
+        :return: dictionary of parameter draws (numpy arrays) with parameter names as dictionary keys
+        """
+
+        if method not in SAMPLING_METHODS:
+            raise ValueError('method should be one of {}.'.format(', '.join(SAMPLING_METHODS)))
+        if rng is None:
+            rng = np.random.default_rng()
+
+        names = self.get_uncertain_names()
+
+        if method == 'mc':
+            draws = {name: self.distributions[name].sample(rng, n) for name in names}
+        else:
+            if method == 'lhs':
+                u = qmc.LatinHypercube(d=len(names), seed=rng).random(n)
+            else:
+                with warnings.catch_warnings():
+                    # Sobol points are best balanced for powers of 2 but any number of draws is allowed
+                    warnings.simplefilter('ignore', UserWarning)
+                    u = qmc.Sobol(d=len(names), scramble=True, seed=rng).random(n)
+            draws = {name: self.distributions[name].ppf(u[:, j]) for j, name in enumerate(names)}
+
+        if not uncertain_only:
+            draws = {name: draws[name] if name in draws else self.distributions[name].sample(rng, n)
+                     for name in self.pointValues}
+        return draws
+
+
+def get_default_registry():
+    """ :return: ParameterRegistry with the InputData values as point values and the PSA distributions """
+
+    registry = ParameterRegistry()
+    for name, value in vars(D).items():
+        if name.isupper():
+            registry.add(name, value)
+
+    # the order of the distributions is the order of the random numbers of the Monte Carlo draws
+    registry.set_distribution('HOSP_COST', Gamma(HOSP_COST_SHAPE, HOSP_COST_SCALE))
+
+    # registry.set_distribution('DRUG_RR_VAX_OR_LR', LogNormal(np.log(0.49), SE_DRUG_VAX_RR))
+    registry.set_distribution('DRUG_RR_VAX_OR_LR', ExpUniform(0.245, 0.735))
+
+    # registry.set_distribution('PAXLOVID_RR_VAX_OR_LR', LogNormal(np.log(0.17), SE_PAX_VAX_RR))
+    registry.set_distribution('PAXLOVID_RR_VAX_OR_LR', ExpUniform(0.085, 0.255))
+
+    # registry.set_distribution('PAXLOVID_RR_UNVAX_HR', LogNormal(np.log(0.60), SE_PAX_UNVAX_RR))
+    registry.set_distribution('PAXLOVID_RR_UNVAX_HR', ExpUniform(0.30, 0.90))
+
+    # registry.set_distribution('DRUG_RR_UNVAX_HR', LogNormal(np.log(0.11), SE_DRUG_UNVAX_RR))
+    registry.set_distribution('DRUG_RR_UNVAX_HR', ExpUniform(0.055, 0.165))
+
+    return registry
@@ -0,0 +1,247 @@
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import Accumulators
+import CostEffectiveness
+import DecisionTree2 as Tree
+import PSA
+
+# functions and methods timed as phases when profiling is enabled: (owner, attribute, phase name)
+PHASES = [(PSA, 'sample_parameters', 'sampling'),
+          (PSA, 'evaluate_draws', 'tree evaluation'),
+          (Tree, 'build_decision_tree', 'tree build'),
+          (Tree.DecisionNode, 'compile', 'tree compile'),
+          (Accumulators.PSAAccumulator, 'add', 'accumulation'),
+          (Accumulators.AcceptabilityCounter, 'add', 'accumulation'),
+          (CostEffectiveness.CEA, 'build_ce_table', 'CEA'),
+          (CostEffectiveness.CEA, 'get_acceptability_curves', 'CEA')]
+
+# methods of nodes that are counted as visits when profiling is enabled: (class, attribute)
+# (get_expected_cost and get_expected_health_utility of nodes call get_expected_values)
+NODE_METHODS = [(Tree.ChanceNode, 'get_expected_values'),
+                (Tree.TerminalNode, 'get_expected_values'),
+                (Tree.DecisionNode, 'get_expected_values')]
+
+
+class Profiler:
+    """ opt-in instrumentation of the evaluation of decision trees and of the PSA
+    enable() replaces the methods of the nodes, CompiledTree.evaluate and the functions of the PSA phases with timed
+    versions and disable() puts the originals back, so nothing is added to the evaluation while profiling is off.
+    visits and times are recorded per node, per strategy (the future node of the decision node a node is
+    evaluated under) and per phase, and every timed call is a frame of a stack whose self times can be exported as
+    collapsed stacks for flame graphs.
+    (worker processes are not instrumented, so profile PSAs with n_workers=1) """
+
+    def __init__(self):
+        self._originals = []
+        self.reset()
+
+    def reset(self):
+        """ discards the recorded visits and times """
+
+        self.phaseCalls = defaultdict(int)
+        self.phaseTimes = defaultdict(float)
+        self.nodeVisits = defaultdict(int)
+        self.nodeTimes = defaultdict(float)       # time in the node and the nodes below it
+        self.nodeSelfTimes = defaultdict(float)   # time in the node itself
+        self.strategyVisits = defaultdict(int)
+        self.strategyTimes = defaultdict(float)
+        self.stackTimes = defaultdict(float)      # self time of each stack of frame names
+
+        # frames of the calls in progress: [name, start time, time of calls below, strategy, if decision node]
+        self._stack = []
+
+    def enable(self):
+        """ instruments the nodes and the PSA phases
+        :return: this profiler (so that 'with Profiler().enable() as profiler:' profiles a block) """
+
+        if self._originals:
+            return self
+
+        for owner, attribute, name in PHASES:
+            self._patch(owner, attribute, self._wrap_phase(getattr(owner, attribute), name))
+        for cls, attribute in NODE_METHODS:
+            self._patch(cls, attribute, self._wrap_node(getattr(cls, attribute)))
+        self._patch(Tree.CompiledTree, 'evaluate', self._wrap_compiled_evaluate(Tree.CompiledTree.evaluate))
+        return self
+
+    def disable(self):
+        """ restores the original functions and methods """
+        for owner, attribute, original in reversed(self._originals):
+            setattr(owner, attribute, original)
+        self._originals = []
+
+    def __enter__(self):
+        return self.enable()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.disable()
+
+    def _patch(self, owner, attribute, replacement):
+        self._originals.append((owner, attribute, vars(owner)[attribute]))
+        setattr(owner, attribute, replacement)
+
+    def _push(self, name, strategy=None, is_decision=False):
+        if strategy is None and self._stack:
+            parent = self._stack[-1]
+            # the strategy of a node is the future node of the decision node it is evaluated under
+            strategy = name if parent[4] else parent[3]
+        self._stack.append([name, time.perf_counter(), 0.0, strategy, is_decision])
+
+    def _pop(self):
+        """ :return: (time of the frame, time of the frame without the frames below it, strategy of the frame) """
+
+        path = tuple(frame[0] for frame in self._stack)
+        name, start, child_time, strategy, _ = self._stack.pop()
+        elapsed = time.perf_counter() - start
+        self.stackTimes[path] += elapsed - child_time
+        if strategy is not None:
+            self.strategyTimes[strategy] += elapsed - child_time
+        if self._stack:
+            self._stack[-1][2] += elapsed
+        return elapsed, elapsed - child_time, strategy
+
+    @contextmanager
+    def phase(self, name):
+        """ times a block of code as a phase (e.g. 'with profiler.phase("CEA"):') """
+        self._push(name)
+        try:
+            yield
+        finally:
+            elapsed, _, _ = self._pop()
+            self.phaseCalls[name] += 1
+            self.phaseTimes[name] += elapsed
+
+    def _wrap_phase(self, function, name):
+
+        def timed(*args, **kwargs):
+            with self.phase(name):
+                return function(*args, **kwargs)
+
+        return timed
+
+    def _wrap_node(self, method):
+
+        def timed(node, *args, **kwargs):
+            self._push(node.name, is_decision=isinstance(node, Tree.DecisionNode))
+            try:
+                return method(node, *args, **kwargs)
+            finally:
+                elapsed, self_time, strategy = self._pop()
+                self.nodeVisits[node.name] += 1
+                self.nodeTimes[node.name] += elapsed
+                self.nodeSelfTimes[node.name] += self_time
+                if strategy is not None:
+                    self.strategyVisits[strategy] += 1
+
+        return timed
+
+    def _wrap_compiled_evaluate(self, method):
+
+        def timed(tree):
+            if tree._expected is not None:
+                return method(tree)
+            with self.phase('tree sweep'):
+                return self._evaluate_compiled(tree)
+
+        return timed
+
+    def _evaluate_compiled(self, tree):
+        """ CompiledTree.evaluate with every edge timed (the time of an edge is recorded as a visit of its child,
+        since that is when the child's expected values are used) """
+
+        paths, strategies = self._get_compiled_paths(tree)
+        prefix = tuple(frame[0] for frame in self._stack)
+
+        exp_costs = list(tree.nodeCosts)
+        exp_utilities = list(tree.nodeUtilities)
+        times = [0.0] * len(tree.nodes)
+        visits = [0] * len(tree.nodes)
+
+        for parent, child, prob in zip(tree.edgeParents.tolist(), tree.edgeChildren.tolist(), tree.edgeProbs):
+            start = time.perf_counter()
+            exp_costs[parent] = exp_costs[parent] + prob * exp_costs[child]
+            exp_utilities[parent] = exp_utilities[parent] + prob * exp_utilities[child]
+            times[child] += time.perf_counter() - start
+            visits[child] += 1
+
+        for i, node in enumerate(tree.nodes):
+            if visits[i] == 0:
+                continue
+            self.nodeVisits[node.name] += visits[i]
+            self.nodeTimes[node.name] += times[i]
+            self.nodeSelfTimes[node.name] += times[i]
+            self.stackTimes[prefix + paths[i]] += times[i]
+            if strategies[i] is not None:
+                self.strategyVisits[strategies[i]] += visits[i]
+                self.strategyTimes[strategies[i]] += times[i]
+
+        # the time of the edges is already recorded per node
+        self._stack[-1][2] += sum(times)
+
+        tree._expected = (exp_costs, exp_utilities)
+        return tree._expected
+
+    @staticmethod
+    def _get_compiled_paths(tree):
+        """ :return: (the first path of node names from the root to each node of a compiled tree,
+        the strategy of each node or 'shared' if it is under several strategies) in the order of tree.nodes """
+
+        paths = {id(tree.root): (tree.root.name,)}
+        strategies = {id(tree.root): None}
+        # nodes are in topological order, so parents are visited from the end
+        for node in reversed(tree.nodes):
+            for child in tree._get_future_nodes(node):
+                strategy = child.name if isinstance(node, Tree.DecisionNode) else strategies[id(node)]
+                if id(child) not in paths:
+                    paths[id(child)] = paths[id(node)] + (child.name,)
+                    strategies[id(child)] = strategy
+                elif strategies[id(child)] != strategy:
+                    strategies[id(child)] = 'shared'
+
+        return [paths[id(node)] for node in tree.nodes], [strategies[id(node)] for node in tree.nodes]
+
+    def get_report(self):
+        """ :return: dictionary of the visits and times (in seconds) per phase, node and strategy """
+
+        def ordered(times):
+            return sorted(times, key=times.get, reverse=True)
+
+        return {'phases': {name: {'calls': self.phaseCalls[name], 'seconds': self.phaseTimes[name]}
+                           for name in ordered(self.phaseTimes)},
+                'nodes': {name: {'visits': self.nodeVisits[name], 'seconds': self.nodeTimes[name],
+                                 'self_seconds': self.nodeSelfTimes[name]}
+                          for name in ordered(self.nodeSelfTimes)},
+                'strategies': {name: {'visits': self.strategyVisits[name], 'seconds': self.strategyTimes[name]}
+                               for name in ordered(self.strategyTimes)}}
+
+    def write_json(self, file_name):
+        """ writes the report (see get_report) to a JSON file """
+        with open(file_name, 'w') as file:
+            json.dump(self.get_report(), file, indent=2)
+
+    def write_collapsed_stacks(self, file_name):
+        """ writes the self time of every stack in the collapsed format of flame graph tools
+        (one 'frame;frame;frame microseconds' line per stack) """
+        with open(file_name, 'w') as file:
+            for path, seconds in sorted(self.stackTimes.items()):
+                microseconds = int(round(seconds * 1e6))
+                if microseconds > 0:
+                    file.write('{} {}\n'.format(';'.join(name.replace(' ', '_') for name in path), microseconds))
+
+
+def profile_psa(n_draws=10000, seed=0, method='mc', chunk_size=PSA.CHUNK_SIZE):
+    """ profiles a PSA and the CEA of its outputs in this process
+    :return: Profiler with the visits and times of the run """
+
+    with Profiler() as profiler:
+        with profiler.phase('PSA'):
+            params, outputs = PSA.run_psa(n_draws=n_draws, seed=seed, n_workers=1, chunk_size=chunk_size,
+                                          method=method)
+            summary = Accumulators.PSAAccumulator()
+            summary.add(outputs)
+        CostEffectiveness.CEA(outputs[:, :5], outputs[:, 5:]).build_ce_table()
+
+    return profiler
@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import CostEffectiveness
+import DecisionTree2
+import InputData
+import PSA
+import ParameterRegistry
+
+CACHE_DIRECTORY = '.cache'
+MAX_BYTES = 2**30  # size of the cache beyond which the least recently used results are evicted
+EXTENSIONS = ('.npz', '.bin', '.json')  # extensions of the files of cached results
+
+# modules whose source determines the results of the model and of the CEA
+MODEL_MODULES = [InputData, DecisionTree2, ParameterRegistry, PSA]
+CEA_MODULES = MODEL_MODULES + [CostEffectiveness]
+
+
+def get_version(modules=MODEL_MODULES):
+    """ :return: hash of the source files of the modules (changes whenever the code of the model changes) """
+    digest = hashlib.sha256()
+    for module in modules:
+        with open(module.__file__, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def _encode(value):
+    """ :return: JSON-serializable form of values that json does not handle (numpy arrays by the hash of their data) """
+    if isinstance(value, np.ndarray):
+        array = np.ascontiguousarray(value)
+        return {'shape': array.shape, 'dtype': str(array.dtype), 'sha256': hashlib.sha256(array.tobytes()).hexdigest()}
+    return str(value)
+
+
+def get_key(kind, **settings):
+    """
+    :param kind: kind of result (e.g. 'psa')
+    :param settings: everything the result depends on (JSON-serializable values or numpy arrays)
+    :return: hash of the kind of result and its settings
+    """
+    text = json.dumps({'kind': kind, 'settings': settings}, sort_keys=True, default=_encode)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def describe_registry(registry):
+    """ :return: (dictionary) point value and distribution (class and attributes) of every parameter """
+    return {name: {'point_value': registry.pointValues[name],
+                   'distribution': [type(dist).__name__, vars(dist)]}
+            for name, dist in registry.distributions.items()}
+
+
+class ResultCache:
+    """ on-disk cache of results keyed by hashes of everything they depend on
+    (dictionaries of numpy arrays are stored as .npz files, bytes (e.g. figures) as .bin files and other results as
+    .json files; when the cache grows beyond its maximum size, the least recently used results are removed) """
+
+    def __init__(self, directory=CACHE_DIRECTORY, max_bytes=MAX_BYTES):
+        """
+        :param directory: directory of the cache
+        :param max_bytes: maximum total size of the cached files
+        """
+        self.directory = directory
+        self.maxBytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _get_path(self, key):
+        """ :return: path of the file of a cached result (or None if the result is not cached) """
+        for extension in EXTENSIONS:
+            path = os.path.join(self.directory, key + extension)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def contains(self, key):
+        """ :return: True if a result with this key is cached """
+        return self._get_path(key) is not None
+
+    def get(self, key):
+        """
+        :return: the cached result (dictionary of numpy arrays, bytes or JSON value) or None if it is not cached
+        """
+
+        path = self._get_path(key)
+        if path is None:
+            return None
+
+        # the modification time of a file records when it was last used
+        os.utime(path)
+        if path.endswith('.npz'):
+            with np.load(path) as data:
+                return {name: data[name] for name in data.files}
+        if path.endswith('.bin'):
+            with open(path, 'rb') as file:
+                return file.read()
+        with open(path) as file:
+            return json.load(file)
+
+    def put(self, key, value):
+        """
+        :param key: key of the result
+        :param value: dictionary of numpy arrays, bytes or a JSON-serializable value
+        (the result is kept even if it is larger than the maximum size of the cache on its own)
+        """
+
+        if isinstance(value, dict) and value and all(isinstance(v, np.ndarray) for v in value.values()):
+            path = os.path.join(self.directory, key + '.npz')
+            # (written to a temporary file first, so an interrupted write does not leave a broken result)
+            with open(path + '.tmp', 'wb') as file:
+                np.savez(file, **value)
+        elif isinstance(value, bytes):
+            path = os.path.join(self.directory, key + '.bin')
+            with open(path + '.tmp', 'wb') as file:
+                file.write(value)
+        else:
+            path = os.path.join(self.directory, key + '.json')
+            with open(path + '.tmp', 'w') as file:
+                json.dump(value, file)
+        os.replace(path + '.tmp', path)
+
+        self.evict(keep=path)
+
+    def get_or_compute(self, key, compute):
+        """
+        :param key: key of the result
+        :param compute: function without arguments that computes the result if it is not cached
+        :return: the result
+        """
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def evict(self, keep=None):
+        """ removes the least recently used results until the cache is within its maximum size
+        :param keep: path of a result that is not removed (e.g. the one just written)
+        """
+
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(EXTENSIONS) and path != keep:
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries) + (os.path.getsize(keep) if keep is not None else 0)
+        for _, size, path in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        """ removes all cached results """
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+
+
+def get_psa_key(n_draws=10000, seed=0, chunk_size=PSA.CHUNK_SIZE, method='mc'):
+    """ :return: key of the results of PSA.run_psa with these settings and the current model and distributions
+    (the number of workers is not part of the key since it does not change the results) """
+    return get_key('psa', registry=describe_registry(PSA.REGISTRY), n_draws=n_draws, seed=seed,
+                   chunk_size=chunk_size, method=method, version=get_version())
+
+
+def run_psa(n_draws=10000, seed=0, n_workers=1, chunk_size=PSA.CHUNK_SIZE, method='mc', cache=None):
+    """ PSA.run_psa with the results read from the cache if the model, distributions and settings are unchanged
+    :param cache: ResultCache (one in the default directory if None)
+    :return: (dictionary of parameter draws, numpy.array of shape (n_draws, 10)) as PSA.run_psa
+    """
+
+    cache = cache if cache is not None else ResultCache()
+
+    def compute():
+        params, outputs = PSA.run_psa(n_draws=n_draws, seed=seed, n_workers=n_workers,
+                                      chunk_size=chunk_size, method=method)
+        return dict(params, outputs=outputs)
+
+    value = cache.get_or_compute(get_psa_key(n_draws, seed, chunk_size, method), compute)
+    outputs = value.pop('outputs')
+    return value, outputs
+
+
+def simulate_scenario(cache=None, **params):
+    """ DecisionTree2.simulate_decision_tree_batch for a scenario, with the result read from the cache if the model
+    and the resolved parameter values are unchanged
+    :param cache: ResultCache (one in the default directory if None)
+    :param params: values of InputData parameters (floats or arrays of draws) with parameter names as keywords
+    :return: (numpy.array) of shape (number of draws, 10) as DecisionTree2.simulate_decision_tree_batch
+    """
+
+    cache = cache if cache is not None else ResultCache()
+    resolved = {name: np.asarray(value, dtype=float)
+                for name, value in vars(DecisionTree2.get_parameters(**params)).items()}
+    key = get_key('scenario', params=resolved, version=get_version())
+
+    return cache.get_or_compute(key, lambda: {'outputs': PSA.evaluate_draws(params)})['outputs']
+
+
+def build_ce_table(psa_key, costs, effects, if_paired=False, health_measure='d', cache=None, **options):
+    """ CostEffectiveness.CEA(...).build_ce_table with the table read from the cache if the PSA results, the
+    options and the code are unchanged
+    :param psa_key: key of the PSA results the table is built from (see get_psa_key)
+    :param costs: (numpy.array) of shape (number of draws, number of strategies)
+    :param effects: (numpy.array) of shape (number of draws, number of strategies)
+    :param if_paired: set to True if the draws of different strategies are paired
+    :param health_measure: 'u' or 'd' (see DecisionTree2.get_effect_multiplier)
+    :param cache: ResultCache (one in the default directory if None)
+    :param options: arguments of CostEffectiveness.CEA.build_ce_table (file_name is written from the cached table)
+    :return: (list) rows of the table
+    """
+
+    cache = cache if cache is not None else ResultCache()
+    file_name = options.pop('file_name', None)
+    key = get_key('ce_table', psa_key=psa_key, if_paired=if_paired, health_measure=health_measure, options=options,
+                  version=get_version(CEA_MODULES))
+
+    table = cache.get_or_compute(key, lambda: CostEffectiveness.CEA(
+        costs, effects, if_paired=if_paired, health_measure=health_measure).build_ce_table(**options))
+
+    if file_name is not None:
+        CostEffectiveness.write_table(table, file_name)
+    return table
@@ -0,0 +1,230 @@
+import csv
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import CostEffectiveness
+import DecisionTree2 as Tree
+import PSA
+import StrategyModel
+
+BASELINE_FILE = 'benchmark_baselines.json'  # baselines of every machine, with machine names as keys
+UPDATE_BASELINE = False     # set to True to replace the baseline of this machine with the results of this run
+TOLERANCE = 0.2             # fraction by which a benchmark may be slower (or use more memory) than its baseline
+
+SEED = 0
+PSA_SIZES = [10**4, 10**6, 10**7]   # numbers of draws of the end-to-end PSA benchmarks
+MIN_SECONDS = 1.0                   # minimum time each throughput benchmark is repeated for
+N_REPEATS = 3                       # number of calls of each timed benchmark (the fastest one is kept)
+
+# health measure and options of the CE tables in CETable_base.csv and CETable_PSA.csv (as in RunDecisionTree)
+CE_TABLE_HEALTH_MEASURE = 'u'
+CE_TABLE_OPTIONS = dict(interval_type='c', alpha=0.05, cost_digits=2, effect_digits=3, icer_digits=3)
+CE_TABLE_DRAWS = 10000
+# relative tolerances of the PSA table, whose reference was produced with another random number stream
+PSA_TABLE_RTOL = 0.01
+PSA_TABLE_ICER_RTOL = 0.02
+
+# whether a larger value of each kind of result is better
+HIGHER_IS_BETTER = {'per_second': True, 'seconds': False, 'bytes': False}
+
+
+def get_rate(function, n_per_call):
+    """ :return: number of evaluations per second of a function that does n_per_call evaluations
+    (the best of repeated calls over at least MIN_SECONDS) """
+
+    best = np.inf
+    start = time.perf_counter()
+    while time.perf_counter() - start < MIN_SECONDS or best == np.inf:
+        t = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - t)
+    return n_per_call / best
+
+
+def get_time(function, n_repeats=N_REPEATS):
+    """ :return: seconds of the fastest of n_repeats calls of a function
+    (a single call is too noisy to compare with a baseline) """
+
+    best = np.inf
+    for _ in range(n_repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def get_peak_memory(function):
+    """ :return: peak memory (bytes) allocated by a function, including numpy arrays """
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def get_cold_start():
+    """ :return: seconds for a new interpreter to import the model and evaluate one PSA draw
+    (the fastest of N_REPEATS interpreters) """
+    return get_time(lambda: subprocess.run(
+        [sys.executable, '-c', 'import PSA; PSA.run_psa(n_draws=1)'], check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))))
+
+
+def check_engines(n_draws=1000):
+    """ evaluates the same PSA draws with the scalar tree, the batch tree and the strategy model and raises an
+    error if they disagree """
+
+    params, _ = PSA.run_psa(n_draws=n_draws, seed=SEED)
+    arguments = {Tree.ARGUMENT_NAMES[name]: value for name, value in params.items()}
+
+    scalar = np.array([Tree.simulate_decision_tree(**{name: value[i] for name, value in arguments.items()})
+                       for i in range(n_draws)])
+    batch = PSA.evaluate_draws(params)
+    np.testing.assert_allclose(batch, scalar, rtol=1e-12, atol=0, err_msg='batch tree != scalar tree')
+
+    strategy_model = StrategyModel.StrategyModel().evaluate(**params)
+    np.testing.assert_allclose(strategy_model, batch, rtol=1e-10, atol=1e-12, err_msg='strategy model != batch tree')
+
+
+def read_table(file_name):
+    """ :return: (list) rows of a CE table written by CostEffectiveness.write_table """
+    with open(file_name, newline='') as file:
+        return [row for row in csv.reader(file)]
+
+
+def parse_cell(cell):
+    """ :return: (list) the numbers in a cell of a CE table (estimate, then the interval), or the text of the
+    cell if it has no numbers ('-' or 'Dominated') """
+    numbers = re.findall(r'-?[\d,]*\.?\d+', cell)
+    return [float(number.replace(',', '')) for number in numbers] if numbers else cell
+
+
+def check_table(table, reference, rtol=0.0, icer_rtol=0.0):
+    """ raises an error if a CE table does not match a reference table: the strategies, their order and the
+    dominated strategies must be identical, estimates must agree within the relative tolerances and the intervals
+    of the ICERs must overlap """
+
+    if [row[0] for row in table] != [row[0] for row in reference]:
+        raise AssertionError('The strategies or their order differ: {} != {}'.format(
+            [row[0] for row in table], [row[0] for row in reference]))
+
+    for row, reference_row in zip(table[1:], reference[1:]):
+        for column, (cell, reference_cell) in enumerate(zip(row, reference_row)):
+            if column == 0:
+                continue
+            value, expected = parse_cell(cell), parse_cell(reference_cell)
+            where = '{} / {}: {} != {}'.format(row[0], table[0][column], cell, reference_cell)
+            if isinstance(value, str) or isinstance(expected, str):
+                if value != expected:
+                    raise AssertionError(where)
+            elif column == len(row) - 1:
+                if abs(value[0] - expected[0]) > icer_rtol * abs(expected[0]) or \
+                        value[2] < expected[1] or value[1] > expected[2]:
+                    raise AssertionError(where)
+            elif abs(value[0] - expected[0]) > rtol * abs(expected[0]):
+                raise AssertionError(where)
+
+
+def check_ce_tables():
+    """ compares the CE tables of the base case and of the PSA with CETable_base.csv and CETable_PSA.csv """
+
+    base = np.repeat(np.array(Tree.simulate_decision_tree())[np.newaxis, :], 2, axis=0)
+    table = CostEffectiveness.CEA(base[:, :5], base[:, 5:], health_measure=CE_TABLE_HEALTH_MEASURE).build_ce_table(
+        **CE_TABLE_OPTIONS)
+    if table != read_table('CETable_base.csv'):
+        raise AssertionError('The base case CE table differs from CETable_base.csv.')
+
+    _, outputs = PSA.run_psa(n_draws=CE_TABLE_DRAWS, seed=SEED)
+    table = CostEffectiveness.CEA(outputs[:, :5], outputs[:, 5:], health_measure=CE_TABLE_HEALTH_MEASURE) \
+        .build_ce_table(**CE_TABLE_OPTIONS)
+    check_table(table, read_table('CETable_PSA.csv'), rtol=PSA_TABLE_RTOL, icer_rtol=PSA_TABLE_ICER_RTOL)
+
+
+def run_benchmarks():
+    """ :return: dictionary of benchmark results with benchmark names as keys
+    (names end with the unit of the result, see HIGHER_IS_BETTER) """
+
+    results = {}
+
+    results['tree_scalar_per_second'] = get_rate(Tree.simulate_decision_tree, 1)
+
+    params, _ = PSA.run_psa(n_draws=10**5, seed=SEED)
+    results['tree_batch_per_second'] = get_rate(lambda: PSA.evaluate_draws(params), 10**5)
+    model = StrategyModel.StrategyModel()
+    results['strategy_model_per_second'] = get_rate(lambda: model.evaluate(**params), 10**5)
+
+    for n_draws in PSA_SIZES:
+        # the largest PSA is summarized with accumulators, since its draws would not fit in memory comfortably
+        if n_draws < max(PSA_SIZES):
+            seconds = get_time(lambda: PSA.run_psa(n_draws=n_draws, seed=SEED))
+        else:
+            seconds = get_time(lambda: PSA.run_psa_summary(n_draws=n_draws, seed=SEED))
+        results['psa_{:.0e}_draws_per_second'.format(n_draws).replace('+0', '')] = n_draws / seconds
+
+    results['psa_1e6_peak_bytes'] = get_peak_memory(lambda: PSA.run_psa(n_draws=10**6, seed=SEED))
+    results['psa_summary_1e6_peak_bytes'] = get_peak_memory(lambda: PSA.run_psa_summary(n_draws=10**6, seed=SEED))
+
+    _, outputs = PSA.run_psa(n_draws=CE_TABLE_DRAWS, seed=SEED)
+    results['ce_table_seconds'] = get_time(
+        lambda: CostEffectiveness.CEA(outputs[:, :5], outputs[:, 5:], health_measure=CE_TABLE_HEALTH_MEASURE)
+        .build_ce_table(**CE_TABLE_OPTIONS))
+
+    results['cold_start_seconds'] = get_cold_start()
+
+    return results
+
+
+def get_regressions(results, baseline, tolerance=TOLERANCE):
+    """ :return: (list) descriptions of the results that are worse than their baseline by more than the tolerance """
+
+    regressions = []
+    for name, value in results.items():
+        if name not in baseline:
+            continue
+        unit = next(unit for unit in HIGHER_IS_BETTER if name.endswith(unit))
+        if HIGHER_IS_BETTER[unit]:
+            change = 1 - value / baseline[name]
+        else:
+            change = value / baseline[name] - 1
+        if change > tolerance:
+            regressions.append('{}: {:.4g} vs baseline {:.4g} ({:.0%} worse)'.format(
+                name, value, baseline[name], change))
+    return regressions
+
+
+if __name__ == '__main__':
+
+    # numerical agreement first, so that a fast but wrong engine never becomes a baseline
+    check_engines()
+    check_ce_tables()
+    print('Engines agree and the CE tables match CETable_base.csv and CETable_PSA.csv.')
+
+    results = run_benchmarks()
+    for name, value in results.items():
+        print('{:40}{:>16.4g}'.format(name, value))
+
+    baselines = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as file:
+            baselines = json.load(file)
+
+    machine = '{} ({}, Python {})'.format(platform.node(), platform.machine(), platform.python_version())
+    if UPDATE_BASELINE or machine not in baselines:
+        baselines[machine] = results
+        with open(BASELINE_FILE, 'w') as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+        print('Baseline of {} written to {}.'.format(machine, BASELINE_FILE))
+    else:
+        regressions = get_regressions(results, baselines[machine])
+        if regressions:
+            sys.exit('Benchmarks slower than their baselines by more than {:.0%}:\n{}'.format(
+                TOLERANCE, '\n'.join(regressions)))
+        print('No benchmark is more than {:.0%} worse than its baseline.'.format(TOLERANCE))
@@ -0,0 +1,226 @@
+import operator
+
+import DecisionTree2 as Tree
+
+
+class Expression:
+    """ arithmetic expression of named model parameters
+    (building a tree with parameters as expressions records the formula of the cost, health utility and
+    probabilities of every node, so that they can be recalculated when only one parameter changes) """
+
+    def __init__(self, op, operands):
+        """
+        :param op: binary operator (e.g. operator.mul)
+        :param operands: (list) the two operands (expressions or numbers)
+        """
+        self.op = op
+        self.operands = operands
+
+    def evaluate(self, values):
+        """
+        :param values: dictionary of parameter values with parameter names as dictionary keys
+        :return: the value of this expression (operations are applied in the order they were written,
+        so the result is identical to calculating with the values directly)
+        """
+        return self.op(*[evaluate(operand, values) for operand in self.operands])
+
+    def get_parameter_names(self):
+        """ :return: (set) names of the parameters this expression depends on """
+        names = set()
+        for operand in self.operands:
+            if isinstance(operand, Expression):
+                names.update(operand.get_parameter_names())
+        return names
+
+    def __add__(self, other):
+        return Expression(operator.add, [self, other])
+
+    def __radd__(self, other):
+        return Expression(operator.add, [other, self])
+
+    def __sub__(self, other):
+        return Expression(operator.sub, [self, other])
+
+    def __rsub__(self, other):
+        return Expression(operator.sub, [other, self])
+
+    def __mul__(self, other):
+        return Expression(operator.mul, [self, other])
+
+    def __rmul__(self, other):
+        return Expression(operator.mul, [other, self])
+
+    def __truediv__(self, other):
+        return Expression(operator.truediv, [self, other])
+
+    def __rtruediv__(self, other):
+        return Expression(operator.truediv, [other, self])
+
+
+class Parameter(Expression):
+    """ a named model parameter (e.g. VAX_HOSP_MULT) """
+
+    def __init__(self, name):
+        Expression.__init__(self, op=None, operands=[])
+        self.name = name
+
+    def evaluate(self, values):
+        return values[self.name]
+
+    def get_parameter_names(self):
+        return {self.name}
+
+
+def evaluate(value, values):
+    """
+    :param value: an expression or a number
+    :param values: dictionary of parameter values with parameter names as dictionary keys
+    :return: the value of the expression (or the number itself)
+    """
+    if isinstance(value, Expression):
+        return value.evaluate(values)
+    return value
+
+
+def get_parameter_names(value):
+    """ :return: (set) names of the parameters an expression or a number depends on """
+    if isinstance(value, Expression):
+        return value.get_parameter_names()
+    return set()
+
+
+class ParameterisedTree:
+    """ decision tree whose nodes depend on named parameters
+    changing a parameter only updates the nodes that depend on it and marks the nodes leading to them as dirty;
+    the next evaluation recalculates these nodes and reuses the cached expected values of all other nodes """
+
+    def __init__(self, build=Tree.build_decision_tree, **overrides):
+        """
+        :param build: function that builds the tree from a namespace of parameters (see DecisionTree2.get_parameters)
+        :param overrides: parameter values to use instead of the InputData values
+        """
+
+        self.values = vars(Tree.get_parameters(**overrides))
+        self.root = build(Tree.get_parameters(**{name: Parameter(name) for name in self.values}))
+        # nodes cache their expected values once their parents are linked
+        self.root.link_parents()
+        self.nodes = Tree.CompiledTree(self.root).nodes
+        self.nRecalculated = 0   # number of nodes recalculated by the last evaluation
+
+        # formulas of the cost, health utility and probabilities of each node
+        self._formulas = {}
+        # dictionary of nodes that depend on each parameter with parameter names as dictionary keys
+        self._dependentNodes = {name: [] for name in self.values}
+
+        for node in self.nodes:
+            formulas = {'cost': node.cost, 'health_utility': node.healthUtility}
+            if isinstance(node, Tree.ChanceNode):
+                formulas['probs'] = node.probs
+            self._formulas[id(node)] = formulas
+
+            names = get_parameter_names(node.cost) | get_parameter_names(node.healthUtility)
+            for prob in formulas.get('probs', []):
+                names |= get_parameter_names(prob)
+            for name in names:
+                self._dependentNodes[name].append(node)
+
+            self._update_node(node)
+
+        # cache the expected values of all nodes, so that changing a parameter only recalculates its dependent nodes
+        self.evaluate()
+
+    def _update_node(self, node):
+        """ recalculates the cost, health utility and probabilities of a node from the current parameter values """
+
+        formulas = self._formulas[id(node)]
+        values = {'cost': evaluate(formulas['cost'], self.values),
+                  'health_utility': evaluate(formulas['health_utility'], self.values)}
+        if 'probs' in formulas:
+            values['probs'] = [evaluate(prob, self.values) for prob in formulas['probs']]
+        node.update(**values)
+
+    def get_dependent_nodes(self, name):
+        """ :return: (list) nodes whose cost, health utility or probabilities depend on the parameter """
+        return self._dependentNodes[name]
+
+    def set_parameter(self, name, value):
+        """ changes the value of a parameter
+        :param name: name of the parameter (as in InputData)
+        :param value: new value
+        """
+        if name not in self.values:
+            raise ValueError('{} is not a parameter of InputData.'.format(name))
+
+        self.values[name] = value
+        for node in self._dependentNodes[name]:
+            self._update_node(node)
+
+    def evaluate(self):
+        """
+        :return: (expected costs, expected health utilities) of the strategies as dictionaries
+        with strategy names as dictionary keys
+        """
+
+        self.nRecalculated = sum(node.ifDirty for node in self.nodes)
+        return self.root.get_expected_values()
+
+
+def one_way_sensitivity(tree, name, values):
+    """ varies one parameter over a grid while all other parameters keep their current value
+    :param tree: a ParameterisedTree
+    :param name: name of the parameter to vary
+    :param values: (list) values of the parameter
+    :return: (list) one dictionary per value with keys 'value', 'cost' and 'health_utility' (dictionaries of
+    expected values with strategy names as keys) and 'n_recalculated' (number of nodes recalculated in this step)
+    """
+
+    base_value = tree.values[name]
+
+    results = []
+    for value in values:
+        tree.set_parameter(name, value)
+        exp_costs, exp_health_utilities = tree.evaluate()
+        results.append({'value': value,
+                        'cost': exp_costs,
+                        'health_utility': exp_health_utilities,
+                        'n_recalculated': tree.nRecalculated})
+
+    # put the tree back to its original state and evaluate it, so that the nodes this parameter marked as dirty
+    # are not counted as recalculated by the next evaluation (e.g. the first step for the next parameter)
+    tree.set_parameter(name, base_value)
+    tree.evaluate()
+
+    return results
+
+
+def tornado(ranges, strategy='C1', base_strategy='C0', tree=None):
+    """ one-way sensitivity analysis of the ICER of a strategy with respect to a base strategy
+    :param ranges: dictionary of (low, high) values with parameter names as dictionary keys
+    :param strategy: name of the strategy
+    :param base_strategy: name of the strategy to compare to
+    :param tree: a ParameterisedTree (one with the InputData values is created if None)
+    :return: (list) one dictionary per parameter, sorted by decreasing width of the ICER range,
+    with keys 'parameter', 'low', 'high', 'icer_low', 'icer_high', 'n_recalculated' (nodes recalculated
+    for the low and high values)
+    """
+
+    if tree is None:
+        tree = ParameterisedTree()
+
+    def get_icer(exp_costs, exp_health_utilities):
+        return (exp_costs[strategy] - exp_costs[base_strategy]) \
+            / (exp_health_utilities[strategy] - exp_health_utilities[base_strategy])
+
+    bars = []
+    for name, (low, high) in ranges.items():
+        result_low, result_high = one_way_sensitivity(tree, name, [low, high])
+        bars.append({'parameter': name,
+                     'low': low,
+                     'high': high,
+                     'icer_low': get_icer(result_low['cost'], result_low['health_utility']),
+                     'icer_high': get_icer(result_high['cost'], result_high['health_utility']),
+                     'n_recalculated': [result_low['n_recalculated'], result_high['n_recalculated']]})
+
+    bars.sort(key=lambda bar: abs(bar['icer_high'] - bar['icer_low']), reverse=True)
+
+    return bars
@@ -0,0 +1,209 @@
+import numpy as np
+import DecisionTree2 as Tree
+
+
+class Stratum:
+    """ a group of patients with the same risk of hospitalization and vaccination status """
+
+    def __init__(self, name, get_probability, get_hosp_probability, vaccinated):
+        """
+        :param name: name of the stratum
+        :param get_probability: function that returns the probability of the stratum from the model parameters
+        :param get_hosp_probability: function that returns the probability of hospitalization without treatment
+            from the model parameters
+        :param vaccinated: True if the patients of this stratum are vaccinated
+        """
+        self.name = name
+        self.get_probability = get_probability
+        self.get_hosp_probability = get_hosp_probability
+        self.vaccinated = vaccinated
+
+
+class Treatment:
+    """ a treatment with its cost and relative risks of hospitalization """
+
+    def __init__(self, name, get_cost, get_rr_vax, get_rr_unvax):
+        """
+        :param name: name of the treatment
+        :param get_cost: function that returns the cost of the treatment from the model parameters
+        :param get_rr_vax: function that returns the relative risk of hospitalization of vaccinated patients
+        :param get_rr_unvax: function that returns the relative risk of hospitalization of unvaccinated patients
+        """
+        self.name = name
+        self.get_cost = get_cost
+        self.get_rr_vax = get_rr_vax
+        self.get_rr_unvax = get_rr_unvax
+
+
+# strata of the decision tree: risk for severe disease x age x comorbidity x vaccination status
+# (p is a namespace of model parameters as returned by DecisionTree2.get_parameters)
+STRATA = [
+    Stratum('HR_65_COMORB_VAX',
+            lambda p: p.HR * p.HR_65 * p.HR_65_COMORB * p.VAX_OVER_65,
+            lambda p: p.HOSP_COMORB_65 * p.VAX_HOSP_MULT, vaccinated=True),
+    Stratum('HR_65_COMORB_UNVAX',
+            lambda p: p.HR * p.HR_65 * p.HR_65_COMORB * (1 - p.VAX_OVER_65),
+            lambda p: p.HOSP_COMORB_65, vaccinated=False),
+    Stratum('HR_65_NOCOMORB_VAX',
+            lambda p: p.HR * p.HR_65 * (1 - p.HR_65_COMORB) * p.VAX_OVER_65,
+            lambda p: p.HOSP_NOCOMORB_65 * p.VAX_HOSP_MULT, vaccinated=True),
+    Stratum('HR_65_NOCOMORB_UNVAX',
+            lambda p: p.HR * p.HR_65 * (1 - p.HR_65_COMORB) * (1 - p.VAX_OVER_65),
+            lambda p: p.HOSP_NOCOMORB_65, vaccinated=False),
+    Stratum('HR_UNDER65_VAX',
+            lambda p: p.HR * (1 - p.HR_65) * p.VAX_UNDER_65,
+            lambda p: p.HOSP_COMORB_UNDER65 * p.VAX_HOSP_MULT, vaccinated=True),
+    Stratum('HR_UNDER65_UNVAX',
+            lambda p: p.HR * (1 - p.HR_65) * (1 - p.VAX_UNDER_65),
+            lambda p: p.HOSP_COMORB_UNDER65, vaccinated=False),
+    Stratum('LR_VAX',
+            lambda p: (1 - p.HR) * p.VAX_UNDER_65,
+            lambda p: p.HOSP_NOCOMORB_UNDER65 * p.VAX_HOSP_MULT, vaccinated=True),
+    Stratum('LR_UNVAX',
+            lambda p: (1 - p.HR) * (1 - p.VAX_UNDER_65),
+            lambda p: p.HOSP_NOCOMORB_UNDER65, vaccinated=False),
+]
+
+TREATMENTS = [
+    Treatment('none', lambda p: 0, lambda p: 1, lambda p: 1),
+    Treatment('drug', lambda p: p.DRUG_COST, lambda p: p.DRUG_RR_VAX_OR_LR, lambda p: p.DRUG_RR_UNVAX_HR),
+    Treatment('paxlovid', lambda p: p.PAXLOVID_COST,
+              lambda p: p.PAXLOVID_RR_VAX_OR_LR, lambda p: p.PAXLOVID_RR_UNVAX_HR),
+]
+
+HIGH_RISK = ['HR_65_COMORB_VAX', 'HR_65_COMORB_UNVAX', 'HR_65_NOCOMORB_VAX', 'HR_65_NOCOMORB_UNVAX',
+             'HR_UNDER65_VAX', 'HR_UNDER65_UNVAX']
+HIGH_RISK_UNVAX = ['HR_65_COMORB_UNVAX', 'HR_65_NOCOMORB_UNVAX', 'HR_UNDER65_UNVAX']
+
+# treatment of each stratum under the strategies of the decision tree (strata that are not listed are not treated)
+# (in C1, the decision tree does not apply VAX_HOSP_MULT to untreated, vaccinated high-risk patients under 65 (VAX_1),
+# so C1 overrides their probability of hospitalization to give the same outcomes as DecisionTree2)
+STRATEGIES = {
+    'C0': {name: 'paxlovid' for name in HIGH_RISK},                     # Paxlovid for high risk (baseline)
+    'C1': dict({name: 'drug' for name in HIGH_RISK_UNVAX},              # high risk and unvaccinated
+               HR_UNDER65_VAX=('none', lambda p: p.HOSP_COMORB_UNDER65)),
+    'C2': {name: 'drug' for name in HIGH_RISK},                         # all high risk
+    'C3': {name: 'drug' for name in HIGH_RISK + ['LR_UNVAX']},          # high risk + low risk and unvaccinated
+    'C4': {name: 'drug' for name in HIGH_RISK + ['LR_VAX', 'LR_UNVAX']},  # all people
+}
+
+
+class StrategyModel:
+    """ the allocation strategies as assignments of treatments to strata
+    the probability, cost and health utility of every (stratum, treatment) pair are calculated once per draw, and
+    the expected cost and health utility of all strategies follow from one matrix product with the
+    (strategies x (strata x treatments + overrides)) assignment matrix, so adding strategies costs little """
+
+    def __init__(self, strategies=STRATEGIES, strata=STRATA, treatments=TREATMENTS):
+        """
+        :param strategies: dictionary of assignments (see add_strategy) with strategy names as dictionary keys
+        :param strata: (list) strata of the population
+        :param treatments: (list) treatments (the first one is used for strata that are not listed in a strategy)
+        """
+
+        self.strata = strata
+        self.treatments = treatments
+        self.strategyNames = []
+        # (list) one row per strategy with the column of the (stratum, treatment) pair assigned to each stratum
+        self.assignments = []
+        # (list) (stratum index, treatment index, function that returns the probability of hospitalization without
+        # treatment) of the pairs whose probability a strategy overrides, with columns after the regular pairs
+        self.overrides = []
+
+        for name, assignment in strategies.items():
+            self.add_strategy(name, assignment)
+
+    def add_strategy(self, name, assignment):
+        """
+        :param name: name of the strategy
+        :param assignment: dictionary of treatment names with stratum names as dictionary keys
+            (strata that are not listed get the first treatment); a value can also be a (treatment name, function
+            that returns the probability of hospitalization without treatment from the model parameters) pair to
+            override the probability of the stratum under this strategy only
+        """
+
+        stratum_names = [stratum.name for stratum in self.strata]
+        treatment_names = [treatment.name for treatment in self.treatments]
+        for stratum_name, value in assignment.items():
+            treatment_name = value[0] if isinstance(value, tuple) else value
+            if stratum_name not in stratum_names:
+                raise ValueError('{} is not a stratum.'.format(stratum_name))
+            if treatment_name not in treatment_names:
+                raise ValueError('{} is not a treatment.'.format(treatment_name))
+
+        row = []
+        for k, stratum in enumerate(self.strata):
+            value = assignment.get(stratum.name, treatment_names[0])
+            if isinstance(value, tuple):
+                row.append(len(self.strata) * len(self.treatments) + len(self.overrides))
+                self.overrides.append((k, treatment_names.index(value[0]), value[1]))
+            else:
+                row.append(k * len(self.treatments) + treatment_names.index(value))
+        self.strategyNames.append(name)
+        self.assignments.append(row)
+
+    def get_assignment_matrix(self):
+        """ :return: (numpy.array) of shape (strategies, strata x treatments + overrides) with 1 where a strategy
+        assigns the treatment to the stratum """
+
+        matrix = np.zeros((len(self.strategyNames), len(self.strata) * len(self.treatments) + len(self.overrides)))
+        np.put_along_axis(matrix, np.array(self.assignments, dtype=int).reshape(len(matrix), -1), 1, axis=1)
+        return matrix
+
+    def get_stratum_outcomes(self, p):
+        """
+        :param p: model parameters as returned by DecisionTree2.get_parameters (floats or arrays of draws)
+        :return: (costs, health utilities) as numpy arrays of shape (draws, strata x treatments + overrides) of each
+        (stratum, treatment) pair and of each override (see add_strategy), weighted by the probability of the
+        stratum
+        """
+
+        costs = []
+        health_utilities = []
+        hosp_cost = p.HOSP_COST
+        for stratum in self.strata:
+            probability = stratum.get_probability(p)
+            hosp_probability = stratum.get_hosp_probability(p)
+            for treatment in self.treatments:
+                rr = treatment.get_rr_vax(p) if stratum.vaccinated else treatment.get_rr_unvax(p)
+                # the health utility is the probability of hospitalization
+                health_utility = hosp_probability * rr
+                costs.append(probability * (treatment.get_cost(p) + health_utility * hosp_cost))
+                health_utilities.append(probability * health_utility)
+
+        for k, j, get_hosp_probability in self.overrides:
+            stratum, treatment = self.strata[k], self.treatments[j]
+            rr = treatment.get_rr_vax(p) if stratum.vaccinated else treatment.get_rr_unvax(p)
+            health_utility = get_hosp_probability(p) * rr
+            costs.append(stratum.get_probability(p) * (treatment.get_cost(p) + health_utility * hosp_cost))
+            health_utilities.append(stratum.get_probability(p) * health_utility)
+
+        costs = np.broadcast_arrays(*[np.atleast_1d(cost) for cost in costs])
+        health_utilities = np.broadcast_arrays(*[np.atleast_1d(h) for h in health_utilities])
+        return np.stack(costs, axis=1), np.stack(health_utilities, axis=1)
+
+    def evaluate(self, chunk_size=2**15, **params):
+        """ evaluates all strategies for a batch of parameter draws
+        :param chunk_size: number of draws evaluated at once
+        :param params: values of InputData parameters (floats or numpy arrays of draws) with parameter names
+            as keywords; other parameters keep their InputData values
+        :return: (numpy.array) of shape (number of draws, 2 * number of strategies) with the expected costs of
+        the strategies followed by their expected health utilities (as DecisionTree2.simulate_decision_tree_batch)
+        """
+
+        names = list(params)
+        values = np.broadcast_arrays(*[np.atleast_1d(np.asarray(params[name], dtype=float)) for name in names]) \
+            if names else []
+        n_draws = len(values[0]) if names else 1
+        matrix = self.get_assignment_matrix().T
+        n_strategies = len(self.strategyNames)
+
+        result = np.empty((n_draws, 2 * n_strategies))
+        for start in range(0, n_draws, chunk_size):
+            end = min(start + chunk_size, n_draws)
+            p = Tree.get_parameters(**{name: value[start:end] for name, value in zip(names, values)})
+            costs, health_utilities = self.get_stratum_outcomes(p)
+            result[start:end, :n_strategies] = costs @ matrix
+            result[start:end, n_strategies:] = health_utilities @ matrix
+
+        return result
@@ -0,0 +1,115 @@
+import numpy as np
+import DecisionTree2 as Tree
+import InputData as D
+from DecisionTree2 import STRATEGIES
+
+COST_PARAMETERS = ['DRUG_COST', 'PAXLOVID_COST', 'HOSP_COST']
+
+
+class ThresholdAnalysis:
+    """ break-even values of cost parameters from the affine form of the expected costs
+    (the tree is evaluated once to find the intercepts and partial derivatives of the expected costs with respect
+    to DRUG_COST, PAXLOVID_COST and HOSP_COST; thresholds and two-way grids then follow without re-simulation) """
+
+    def __init__(self, params=None, health_measure='d'):
+        """
+        :param params: dictionary of parameter draws with InputData parameter names as dictionary keys
+            (e.g. from PSA.run_psa; InputData values are used if None)
+        :param health_measure: 'u' or 'd' (see DecisionTree2.get_effect_multiplier)
+        """
+
+        multiplier = Tree.get_effect_multiplier(health_measure)
+        params = params or {}
+        self.intercepts, self.coefficients, effects = Tree.get_cost_coefficients(COST_PARAMETERS, **params)
+        # effect of each draw and strategy as health gained
+        self.effects = effects * multiplier
+
+        # values of the cost parameters of each draw
+        n_draws = len(self.intercepts)
+        self.costs = {name: np.broadcast_to(np.asarray(params.get(name, getattr(D, name)), dtype=float), (n_draws,))
+                      for name in COST_PARAMETERS}
+
+    def get_expected_costs(self, **cost_values):
+        """
+        :param cost_values: values of cost parameters (floats or arrays of draws) with parameter names as keywords;
+            the other cost parameters keep the values of the draws
+        :return: (numpy.array) of shape (number of draws, 5) of the expected costs of strategies C0-C4
+        """
+
+        for name in cost_values:
+            if name not in COST_PARAMETERS:
+                raise ValueError('{} is not one of the cost parameters {}.'.format(name, ', '.join(COST_PARAMETERS)))
+
+        costs = np.stack([np.broadcast_to(cost_values.get(name, self.costs[name]), (len(self.intercepts),))
+                          for name in COST_PARAMETERS], axis=1)
+        return self.intercepts + np.einsum('nsj,nj->ns', self.coefficients, costs)
+
+    def get_break_even(self, name, strategy, comparator, wtp=0):
+        """ value of a cost parameter at which a strategy and a comparator have the same net monetary benefit,
+        i.e. at which the ICER of the strategy with respect to the comparator equals the willingness-to-pay
+        :param name: name of the cost parameter (e.g. 'DRUG_COST' for the break-even price of PEG-lambda)
+        :param strategy: name of the strategy (e.g. 'C1')
+        :param comparator: name of the strategy to compare to (e.g. 'C0')
+        :param wtp: willingness-to-pay per unit of health gained
+        :return: (numpy.array) break-even value for each draw (inf or nan if the cost parameter does not change
+            the difference in cost of the two strategies)
+        """
+
+        if name not in COST_PARAMETERS:
+            raise ValueError('{} is not one of the cost parameters {}.'.format(name, ', '.join(COST_PARAMETERS)))
+
+        s = STRATEGIES.index(strategy)
+        c = STRATEGIES.index(comparator)
+        j = COST_PARAMETERS.index(name)
+
+        d_coefficients = self.coefficients[:, s] - self.coefficients[:, c]
+        d_effects = self.effects[:, s] - self.effects[:, c]
+
+        # difference in cost without the contribution of this cost parameter
+        other_costs = self.intercepts[:, s] - self.intercepts[:, c]
+        for k, other in enumerate(COST_PARAMETERS):
+            if k != j:
+                other_costs = other_costs + d_coefficients[:, k] * self.costs[other]
+
+        # d_cost(x) = other_costs + d_coefficients[j] * x = wtp * d_effects
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (wtp * d_effects - other_costs) / d_coefficients[:, j]
+
+    def get_break_even_table(self, name, wtp=0):
+        """
+        :return: dictionary of break-even values of the cost parameter (arrays over draws) for every pair of
+        strategies, with (strategy, comparator) as dictionary keys
+        """
+        return {(STRATEGIES[s], STRATEGIES[c]): self.get_break_even(name, STRATEGIES[s], STRATEGIES[c], wtp)
+                for s in range(len(STRATEGIES)) for c in range(s)}
+
+    def get_two_way_grid(self, name_x, values_x, name_y, values_y, wtp):
+        """ expected net monetary benefit of the strategies over a grid of values of two cost parameters
+        (with the expected costs averaged over the draws)
+        :param name_x: name of the first cost parameter
+        :param values_x: values of the first cost parameter
+        :param name_y: name of the second cost parameter
+        :param values_y: values of the second cost parameter
+        :param wtp: willingness-to-pay per unit of health gained
+        :return: (expected net monetary benefit as a numpy.array of shape (5, len(values_y), len(values_x)),
+                  index of the strategy with the highest expected net monetary benefit as a numpy.array of shape
+                  (len(values_y), len(values_x)))
+        """
+
+        if name_x == name_y:
+            raise ValueError('The two cost parameters should be different.')
+
+        # expected cost = mean intercept + mean coefficients * costs, where the costs of the parameters that are
+        # not on the grid are those of the draws
+        j_x = COST_PARAMETERS.index(name_x)
+        j_y = COST_PARAMETERS.index(name_y)
+        base = self.get_expected_costs(**{name_x: 0, name_y: 0}).mean(axis=0)
+        mean_coefficients = self.coefficients.mean(axis=0)
+
+        x, y = np.meshgrid(np.asarray(values_x, dtype=float), np.asarray(values_y, dtype=float))
+        costs = (base[:, np.newaxis, np.newaxis]
+                 + mean_coefficients[:, j_x, np.newaxis, np.newaxis] * x
+                 + mean_coefficients[:, j_y, np.newaxis, np.newaxis] * y)
+        nmb = wtp * self.effects.mean(axis=0)[:, np.newaxis, np.newaxis] - costs
+
+        return nmb, np.argmax(nmb, axis=0)
@@ -0,0 +1,223 @@
+import numpy as np
+from CostEffectiveness import WTP_GRID
+from DecisionTree2 import get_effect_multiplier
+
+N_KNOTS = 6  # number of knots of the spline of each parameter
+CHUNK_SIZE = 2**16  # number of draws processed at once
+
+
+def get_natural_spline_basis(x, knots):
+    """ natural cubic spline basis (cubic between the knots and linear beyond the boundary knots)
+    :param x: (numpy.array) values of a parameter
+    :param knots: (numpy.array) sorted, distinct knots
+    :return: (numpy.array) of shape (len(x), number of knots) with the intercept as the first column
+    """
+
+    x = np.asarray(x, dtype=float)
+    columns = [np.ones_like(x)]
+    if len(knots) >= 2:
+        columns.append(x)
+    if len(knots) >= 3:
+        def d(k):
+            return (np.maximum(x - knots[k], 0) ** 3 - np.maximum(x - knots[-1], 0) ** 3) / (knots[-1] - knots[k])
+        d_last = d(len(knots) - 2)
+        for k in range(len(knots) - 2):
+            columns.append(d(k) - d_last)
+    return np.stack(columns, axis=1)
+
+
+class SplineMetamodel:
+    """ regression of PSA outputs on a group of parameters with natural cubic splines (an additive model, or a
+    tensor product of the splines of each parameter to also capture interactions);
+    the fit only needs the sums of squares and cross-products of the basis, accumulated chunk by chunk """
+
+    def __init__(self, params, group, n_knots=N_KNOTS, interactions=None):
+        """
+        :param params: dictionary of parameter draws with parameter names as dictionary keys
+        :param group: (list) names of the parameters to regress on
+        :param n_knots: number of knots of the spline of each parameter (placed at quantiles of the draws)
+        :param interactions: set to True for a tensor-product basis and False for an additive basis
+            (if None, a tensor product is used for groups of up to 2 parameters)
+        """
+
+        for name in group:
+            if name not in params:
+                raise ValueError('{} is not among the sampled parameters.'.format(name))
+
+        self.group = list(group)
+        self.interactions = len(self.group) <= 2 if interactions is None else interactions
+        self.coefficients = None
+
+        # parameters are standardized so that the cubes of the basis stay of order 1
+        self._centers = {}
+        self._scales = {}
+        self._knots = {}
+        for name in self.group:
+            x = np.asarray(params[name], dtype=float)
+            scale = np.std(x)
+            self._centers[name] = np.mean(x)
+            self._scales[name] = scale if scale > 0 else 1
+            # a parameter that is not varied gets a basis with the intercept only
+            self._knots[name] = np.unique(np.quantile((x - self._centers[name]) / self._scales[name],
+                                                      np.linspace(0, 1, n_knots))) if scale > 0 else np.zeros(1)
+
+    def get_basis(self, params, start=0, end=None):
+        """ :return: (numpy.array) design matrix of the draws start to end """
+
+        bases = [get_natural_spline_basis(
+            (np.asarray(params[name][start:end], dtype=float) - self._centers[name]) / self._scales[name],
+            self._knots[name]) for name in self.group]
+
+        if self.interactions:
+            basis = bases[0]
+            for other in bases[1:]:
+                basis = (basis[:, :, np.newaxis] * other[:, np.newaxis, :]).reshape(len(basis), -1)
+            return basis
+        return np.concatenate([bases[0]] + [b[:, 1:] for b in bases[1:]], axis=1)
+
+    def fit(self, params, y, chunk_size=CHUNK_SIZE):
+        """
+        :param params: dictionary of parameter draws with parameter names as dictionary keys
+        :param y: (numpy.array) of shape (number of draws, number of outcomes)
+        :param chunk_size: number of draws processed at once
+        :return: (numpy.array) fitted values of the outcomes, of the same shape as y
+        """
+
+        n = len(y)
+        gram = None
+        for start in range(0, n, chunk_size):
+            end = min(start + chunk_size, n)
+            x = self.get_basis(params, start, end)
+            if gram is None:
+                gram = np.zeros((x.shape[1], x.shape[1]))
+                xty = np.zeros((x.shape[1], y.shape[1]))
+            gram += x.T @ x
+            xty += x.T @ y[start:end]
+
+        # least squares also handles a singular basis (e.g. more columns than distinct parameter values)
+        self.coefficients = np.linalg.lstsq(gram, xty, rcond=None)[0]
+
+        fitted = np.empty_like(y, dtype=float)
+        for start in range(0, n, chunk_size):
+            end = min(start + chunk_size, n)
+            fitted[start:end] = self.get_basis(params, start, end) @ self.coefficients
+        return fitted
+
+
+class ValueOfInformation:
+    """ expected value of perfect information (EVPI) and of partial perfect information (EVPPI) from the PSA draws
+    the EVPPI of a group of parameters uses the single-loop regression estimator: the conditional expectation of
+    the net monetary benefit given the group is estimated by regressing the incremental costs and effects on
+    splines of the parameters, so no nested simulation of the decision tree is needed """
+
+    def __init__(self, params, outputs, health_measure='d'):
+        """
+        :param params: dictionary of parameter draws with parameter names as dictionary keys
+            (e.g. from PSA.run_psa or DrawStore.get_params)
+        :param outputs: (numpy.array) of shape (number of draws, 2 * number of strategies) with the costs of the
+            strategies followed by their effects (e.g. from PSA.run_psa or DrawStore.get_outputs)
+        :param health_measure: 'u' or 'd' (see DecisionTree2.get_effect_multiplier)
+        """
+
+        multiplier = get_effect_multiplier(health_measure)
+        outputs = np.asarray(outputs, dtype=float)
+        n = outputs.shape[1] // 2
+        self.params = params
+        # costs and effects of each strategy with respect to the first strategy (effect as health gained)
+        self.dCosts = outputs[:, 1:n] - outputs[:, [0]]
+        self.dEffects = (outputs[:, n + 1:] - outputs[:, [n]]) * multiplier
+
+    @staticmethod
+    def _get_value_of_information(d_costs, d_effects, wtps):
+        """ :return: (numpy.array) E[max over strategies of NMB] - max over strategies of E[NMB] at each wtp
+        (with net monetary benefits taken with respect to the first strategy) """
+
+        wtps = np.asarray(wtps, dtype=float)
+        order = np.argsort(wtps)
+        sorted_wtps = wtps[order]
+        n = len(d_costs)
+
+        # the net monetary benefit of each strategy is a line in wtp (slope: effect, intercept: -cost);
+        # the maximum over strategies of each draw is the upper envelope of these lines, which is found segment
+        # by segment for all draws at once, instead of evaluating every draw, strategy and wtp value
+        slopes = np.concatenate([np.zeros((n, 1)), d_effects], axis=1)
+        costs = np.concatenate([np.zeros((n, 1)), d_costs], axis=1)
+        rows = np.arange(n)
+
+        # sums of the slopes and costs of the lines that are on the envelopes at each wtp value
+        # (accumulated as differences at the wtp values where lines enter and leave the envelopes)
+        slope_changes = np.zeros(len(wtps) + 1)
+        cost_changes = np.zeros(len(wtps) + 1)
+
+        start = np.full(n, sorted_wtps[0])
+        nmb = slopes * sorted_wtps[0] - costs
+        # at ties, the line with the larger slope is the one that stays on the envelope
+        best = nmb.max(axis=1, keepdims=True)
+        line = np.argmax(np.where(nmb == best, slopes, -np.inf), axis=1)
+
+        for _ in range(slopes.shape[1]):
+            slope = slopes[rows, line]
+            cost = costs[rows, line]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                # wtp values where the lines with larger slopes cross the current line
+                crossings = np.where(slopes > slope[:, np.newaxis],
+                                     (costs - cost[:, np.newaxis]) / (slopes - slope[:, np.newaxis]), np.inf)
+            end = crossings.min(axis=1)
+            # numerical round-off must not move the end of a segment before its start
+            end = np.maximum(end, start)
+
+            i_start = np.searchsorted(sorted_wtps, start, side='left')
+            i_end = np.searchsorted(sorted_wtps, end, side='left')
+            slope_changes += np.bincount(i_start, slope, len(wtps) + 1) - np.bincount(i_end, slope, len(wtps) + 1)
+            cost_changes += np.bincount(i_start, cost, len(wtps) + 1) - np.bincount(i_end, cost, len(wtps) + 1)
+
+            if np.all(np.isinf(end)):
+                break
+            line = np.where(np.isinf(end), line,
+                            np.argmax(np.where(crossings == end[:, np.newaxis], slopes, -np.inf), axis=1))
+            start = end
+
+        expected_max = np.empty(len(wtps))
+        expected_max[order] = (np.cumsum(slope_changes)[:-1] * sorted_wtps - np.cumsum(cost_changes)[:-1]) / n
+
+        max_expected = np.maximum(np.outer(wtps, d_effects.mean(axis=0)) - d_costs.mean(axis=0), 0).max(axis=1)
+        return expected_max - max_expected
+
+    def get_evpi(self, wtps=WTP_GRID):
+        """
+        :param wtps: willingness-to-pay values
+        :return: (numpy.array) expected value of perfect information (per person) at each wtp value
+        """
+        return self._get_value_of_information(self.dCosts, self.dEffects, wtps)
+
+    def get_evppi(self, group, wtps=WTP_GRID, n_knots=N_KNOTS, interactions=None):
+        """
+        :param group: name of a parameter or (list) names of a group of parameters
+        :param wtps: willingness-to-pay values
+        :param n_knots: number of knots of the spline of each parameter
+        :param interactions: see SplineMetamodel
+        :return: (numpy.array) expected value of partial perfect information (per person) at each wtp value
+        """
+
+        if isinstance(group, str):
+            group = [group]
+
+        n_others = self.dCosts.shape[1]
+        metamodel = SplineMetamodel(self.params, group, n_knots, interactions)
+        # net monetary benefit is linear in costs and effects, so one fit serves all wtp values
+        fitted = metamodel.fit(self.params, np.concatenate([self.dCosts, self.dEffects], axis=1))
+
+        return self._get_value_of_information(fitted[:, :n_others], fitted[:, n_others:], wtps)
+
+    def get_evppis(self, groups, wtps=WTP_GRID, n_knots=N_KNOTS, interactions=None):
+        """
+        :param groups: (list) parameter names or lists of parameter names
+        :return: dictionary of EVPPI arrays with parameter names (or names of the group joined by ' + ')
+            as dictionary keys
+        """
+
+        evppis = {}
+        for group in groups:
+            key = group if isinstance(group, str) else ' + '.join(group)
+            evppis[key] = self.get_evppi(group, wtps, n_knots, interactions)
+        return evppis
@@ -0,0 +1,367 @@
+import asyncio
+import json
+import math
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+import Accumulators
+import DecisionTree2 as Tree
+import PSA
+import Sensitivity
+from DecisionTree2 import STRATEGIES
+
+HOST = '127.0.0.1'
+PORT = 8573
+BATCH_WINDOW = 0.002    # seconds a query waits for other queries to be evaluated with
+MAX_BATCH_SIZE = 4096   # number of queries evaluated at once
+PSA_CHUNK_SIZE = 2**14  # number of draws between progress messages of a PSA
+MAX_PSA_DRAWS = 10**7
+
+# names of the model parameters that queries can change
+PARAMETER_NAMES = set(vars(Tree.get_parameters()))
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class RequestError(Exception):
+    """ an error in a request, reported to the client with an HTTP status """
+
+    def __init__(self, message, status=400):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class StreamError(Exception):
+    """ an error while a response is streamed, after its status was sent
+    (the error is reported as the last message of the stream and the connection is closed) """
+
+
+def get_query_params(query):
+    """
+    :param query: dictionary of parameter values with InputData parameter names as keys
+    :return: dictionary of parameter values as floats
+    """
+
+    if not isinstance(query, dict):
+        raise RequestError('A query should be an object of parameter values.')
+    params = {}
+    for name, value in query.items():
+        if name not in PARAMETER_NAMES:
+            raise RequestError('{} is not a parameter of InputData.'.format(name))
+        try:
+            params[name] = float(value)
+        except (TypeError, ValueError):
+            raise RequestError('The value of {} should be a number.'.format(name))
+        if not math.isfinite(params[name]):
+            raise RequestError('The value of {} should be finite.'.format(name))
+    return params
+
+
+def get_results(outputs):
+    """
+    :param outputs: (numpy.array) of shape (number of queries, 10) of the outputs of the decision tree
+    :return: (list) one dictionary per query with the expected cost and effect (probability of hospitalization)
+        of each strategy and the ICER of each strategy with respect to the base strategy C0 (None if the effects
+        are equal)
+    """
+
+    n = len(STRATEGIES)
+    d_costs = outputs[:, 1:n] - outputs[:, [0]]
+    d_effects = outputs[:, n + 1:] - outputs[:, [n]]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        icers = np.where(d_effects != 0, d_costs / d_effects, np.nan)
+
+    results = []
+    for row, icer_row in zip(outputs.tolist(), icers.tolist()):
+        results.append({'costs': dict(zip(STRATEGIES, row[:n])),
+                        'effects': dict(zip(STRATEGIES, row[n:])),
+                        'icers': {name: None if math.isnan(icer) else icer
+                                  for name, icer in zip(STRATEGIES[1:], icer_row)}})
+    return results
+
+
+class WarmModel:
+    """ the decision tree kept in memory between batches of queries
+    (a Sensitivity.ParameterisedTree: the parameters set by a batch hold one value per query, and only the nodes
+    that depend on them, and on the parameters of the previous batch, are recalculated) """
+
+    def __init__(self):
+        self.tree = Sensitivity.ParameterisedTree()
+        self.defaults = dict(self.tree.values)
+        self.changed = set()    # parameters that do not have their InputData value
+
+    def evaluate(self, queries):
+        """
+        :param queries: (list) dictionaries of parameter values (floats); parameters that a query does not set
+            keep their InputData values
+        :return: (numpy.array) of shape (number of queries, 10) of the outputs of the decision tree
+        """
+
+        names = set().union(*queries)
+        for name in self.changed - names:
+            self.tree.set_parameter(name, self.defaults[name])
+        for name in names:
+            self.tree.set_parameter(name, np.array([query.get(name, self.defaults[name]) for query in queries]))
+        self.changed = names
+
+        exp_costs, exp_health_utilities = self.tree.evaluate()
+        outputs = np.empty((len(queries), 2 * len(STRATEGIES)))
+        for i, name in enumerate(STRATEGIES):
+            outputs[:, i] = exp_costs[name]
+            outputs[:, len(STRATEGIES) + i] = exp_health_utilities[name]
+        return outputs
+
+
+class Batcher:
+    """ coalesces the queries that arrive within BATCH_WINDOW seconds of each other into one evaluation
+    (the first query of a batch waits for the window to close, or for the batch to fill, and the whole batch is
+    then evaluated as draws of one vectorized pass over the tree) """
+
+    def __init__(self, evaluate, window=BATCH_WINDOW, max_size=MAX_BATCH_SIZE):
+        """
+        :param evaluate: function that returns the outputs of the decision tree for a list of queries
+            (e.g. WarmModel.evaluate)
+        :param window: seconds the first query of a batch waits for other queries
+        :param max_size: number of queries at which a batch is evaluated without waiting
+        """
+        self.evaluate = evaluate
+        self.window = window
+        self.maxSize = max_size
+        self.queries = []
+        self.futures = []
+        self._timer = None
+
+    def submit(self, params):
+        """
+        :param params: dictionary of parameter values of a query
+        :return: asyncio.Future of the result of this query (see get_results)
+        """
+
+        future = asyncio.get_running_loop().create_future()
+        self.queries.append(params)
+        self.futures.append(future)
+
+        if len(self.queries) >= self.maxSize:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self.flush)
+        return future
+
+    def flush(self):
+        """ evaluates the queries that are waiting """
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        queries, futures = self.queries, self.futures
+        self.queries, self.futures = [], []
+        if not queries:
+            return
+
+        try:
+            results = get_results(self.evaluate(queries))
+        except Exception as error:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
+
+
+class WhatIfServer:
+    """ local HTTP service that keeps the model in memory and answers what-if queries
+    GET /evaluate?DRUG_COST=500&VAX_HOSP_MULT=0.3 or POST /evaluate with a JSON object of parameter values
+        (or a list of such objects): expected costs, effects and ICERs of the strategies as JSON
+    POST /psa with {"n_draws": ..., "seed": ..., "method": ...}: progress of a PSA streamed as newline-delimited
+        JSON, ending with a summary of the costs, effects and ICERs (or with an error message if the PSA fails) """
+
+    def __init__(self, host=HOST, port=PORT, window=BATCH_WINDOW, max_batch_size=MAX_BATCH_SIZE):
+        self.host = host
+        self.port = port
+        self.model = WarmModel()
+        self.batcher = Batcher(self.model.evaluate, window, max_batch_size)
+        self.server = None
+
+    async def start(self):
+        """ starts listening (use port 0 to listen on any free port; self.port is then the chosen port) """
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle_connection(self, reader, writer):
+        """ answers the requests of one connection (connections are kept alive unless the client closes them) """
+
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except RequestError as error:
+                    # the end of the request is unknown, so the connection cannot be kept alive
+                    self._write_response(writer, error.status, {'error': str(error)}, False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+
+                try:
+                    await self._route(method, target, body, writer, keep_alive)
+                except RequestError as error:
+                    self._write_response(writer, error.status, {'error': str(error)}, keep_alive)
+                except StreamError:
+                    keep_alive = False
+                except Exception as error:
+                    self._write_response(writer, 500, {'error': repr(error)}, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader):
+        """ :return: (method, target, headers, body) of the next request, or None if the connection is closed
+        (raises a RequestError if the length of the body is not valid) """
+
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode('latin-1').split(' ', 2)
+        except ValueError:
+            return None
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise RequestError('Content-Length should be a non-negative integer.')
+        body = await reader.readexactly(length) if length > 0 else b''
+        return method, target, headers, body
+
+    async def _route(self, method, target, body, writer, keep_alive):
+
+        url = urlsplit(target)
+        if url.path == '/evaluate':
+            if method == 'GET':
+                query = dict(parse_qsl(url.query))
+            elif method == 'POST':
+                query = self._parse_json(body)
+            else:
+                raise RequestError('Use GET or POST.', 405)
+            self._write_response(writer, 200, await self.evaluate(query), keep_alive)
+        elif url.path == '/psa':
+            if method != 'POST':
+                raise RequestError('Use POST.', 405)
+            await self._stream_psa(self._parse_json(body) if body else {}, writer, keep_alive)
+        else:
+            raise RequestError('Unknown path {}.'.format(url.path), 404)
+
+    @staticmethod
+    def _parse_json(body):
+        try:
+            return json.loads(body)
+        except ValueError:
+            raise RequestError('The body should be JSON.')
+
+    async def evaluate(self, query):
+        """
+        :param query: dictionary of parameter values, or a list of them
+        :return: result of the query (see get_results), or a list of results
+        """
+
+        if isinstance(query, list):
+            return list(await asyncio.gather(*[self.batcher.submit(get_query_params(q)) for q in query]))
+        return await self.batcher.submit(get_query_params(query))
+
+    async def _stream_psa(self, settings, writer, keep_alive):
+        """ runs a PSA in a worker thread, chunk by chunk, and writes a progress message after each chunk """
+
+        try:
+            n_draws = int(settings.get('n_draws', 10000))
+            seed = int(settings.get('seed', 0))
+        except (TypeError, ValueError):
+            raise RequestError('n_draws and seed should be integers.')
+        method = settings.get('method', 'mc')
+        if not 1 <= n_draws <= MAX_PSA_DRAWS:
+            raise RequestError('n_draws should be between 1 and {}.'.format(MAX_PSA_DRAWS))
+        if method not in ('mc', 'lhs', 'sobol'):
+            raise RequestError("method should be 'mc', 'lhs' or 'sobol'.")
+
+        writer.write('HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n'
+                     'Connection: {}\r\n\r\n'.format('keep-alive' if keep_alive else 'close').encode())
+
+        loop = asyncio.get_running_loop()
+        accumulator = Accumulators.PSAAccumulator()
+        try:
+            for seed_sequence, n in PSA.get_chunks(n_draws, seed, PSA_CHUNK_SIZE):
+                accumulator.merge(await loop.run_in_executor(None, PSA.run_chunk_summary, seed_sequence, n, method))
+                self._write_chunk(writer, {'draws': accumulator.get_n(), 'n_draws': n_draws})
+                await writer.drain()
+
+            self._write_chunk(writer, {'summary': get_psa_summary(accumulator)})
+        except ConnectionError:
+            raise
+        except Exception as error:
+            # the status is already sent, so the error ends the stream instead
+            self._write_chunk(writer, {'error': repr(error)})
+            writer.write(b'0\r\n\r\n')
+            raise StreamError(repr(error))
+        writer.write(b'0\r\n\r\n')
+
+    @staticmethod
+    def _write_chunk(writer, message):
+        data = (json.dumps(message) + '\n').encode()
+        writer.write('{:x}\r\n'.format(len(data)).encode() + data + b'\r\n')
+
+    @staticmethod
+    def _write_response(writer, status, message, keep_alive):
+        data = json.dumps(message).encode()
+        writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n'
+                     .format(status, REASONS[status], len(data), 'keep-alive' if keep_alive else 'close').encode()
+                     + data)
+
+
+def get_psa_summary(accumulator, alpha=0.05):
+    """ :return: dictionary with the mean cost and effect of each strategy and the ICER (with its confidence
+    interval) of each strategy with respect to the base strategy C0 """
+
+    summaries = [accumulator.get_summary(i, alpha=alpha) for i in range(len(STRATEGIES))]
+    icers = {}
+    for i, name in enumerate(STRATEGIES[1:], start=1):
+        icer, (lower, upper) = accumulator.get_icer(i, alpha)
+        icers[name] = {'icer': float(icer), 'ci': [float(lower), float(upper)]}
+
+    return {'n_draws': accumulator.get_n(),
+            'costs': {name: float(s['cost']['mean']) for name, s in zip(STRATEGIES, summaries)},
+            'effects': {name: float(s['effect']['mean']) for name, s in zip(STRATEGIES, summaries)},
+            'icers': icers}
+
+
+if __name__ == '__main__':
+    server = WhatIfServer()
+    print('Serving what-if queries on http://{}:{}'.format(HOST, PORT))
+    asyncio.run(server.serve_forever())